@@ -0,0 +1,90 @@
+import json
+import time
+
+import click
+
+def job_args(job, path):
+  """The command line for a manifest job: its input, which can be a list of
+     paths, as arguments and everything else as --options"""
+
+  args = []
+  for name, value in job.items():
+    if name in ('command', 'input'):
+      continue
+    values = value if isinstance(value, list) else [value]
+    for value in values:
+      if value is True:
+        args.append(f'--{name}')
+      elif value is not False and value is not None:
+        args += [f'--{name}', str(value)]
+
+  inputs = job.get('input')
+  if inputs is None:
+    raise click.ClickException(f'{path}: every job needs an input')
+  return [*args, '--', *(inputs if isinstance(inputs, list) else [inputs])]
+
+def load_manifest(path):
+  """Returns the jobs in the manifest at path, with its defaults applied"""
+
+  with open(path) as f:
+    manifest = json.load(f)
+  if isinstance(manifest, list):
+    manifest = {'jobs': manifest}
+
+  defaults = manifest.get('defaults', {})
+  jobs = []
+  for job in manifest.get('jobs', []):
+    if job.get('command') in (None, 'batch'):
+      raise click.ClickException(f'{path}: every job needs a command other than batch')
+    jobs.append({**defaults.get(job['command'], {}), **job})
+  return jobs
+
+@click.command()
+@click.argument('manifest_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('-k', '--keep-going', 'keep_going', is_flag=True,
+              help='Carry on with the other jobs when one fails')
+@click.pass_context
+def batch(ctx, manifest_path, keep_going):
+  """Runs the jobs listed in manifest_path in this one process. Modules,
+     header maps and date caches are then loaded once for every file, rather
+     than once per run of beacon.
+
+  The manifest is a JSON list of jobs, or {"defaults": {command: {...}},
+  "jobs": [...]}. A job has the command to run, its input path or paths,
+  and its options by their long names, eg.
+
+    {"command": "prepare-calls", "input": "camden/calls.csv",
+     "output-dir": "camden/output", "food-needs-user": 12, ...}"""
+
+  jobs = load_manifest(manifest_path)
+  group, group_ctx = ctx.parent.command, ctx.parent
+  # Every command is looked up, and imported, before the first job runs
+  commands = [group.get_command(group_ctx, job['command']) for job in jobs]
+  for job, command in zip(jobs, commands):
+    if command is None:
+      raise click.ClickException(f'{manifest_path}: there is no {job["command"]} command')
+
+  failed = 0
+  for number, (job, command) in enumerate(zip(jobs, commands), 1):
+    name = job['command']
+    inputs = job.get('input')
+    label = f'[{number}/{len(jobs)}] {name} {" ".join(inputs) if isinstance(inputs, list) else inputs}'
+    click.echo(label, err=True)
+    started = time.perf_counter()
+    try:
+      with command.make_context(name, job_args(job, manifest_path), parent=group_ctx) as job_ctx:
+        command.invoke(job_ctx)
+    except (click.Abort, click.exceptions.Exit):
+      raise
+    except Exception as e:
+      if not keep_going:
+        raise
+      failed += 1
+      message = (e.format_message() if isinstance(e, click.ClickException)
+                 else f'{type(e).__name__}: {e}')
+      click.echo(f'{label} failed: {message}', err=True)
+      continue
+    click.echo(f'{label} took {time.perf_counter() - started:.2f}s', err=True)
+
+  if failed:
+    raise click.ClickException(f'{failed} of {len(jobs)} jobs failed')
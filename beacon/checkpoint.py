@@ -0,0 +1,90 @@
+import json
+import os
+import time
+from collections import namedtuple
+from os.path import abspath, join
+
+import click
+
+# Output name marking that every output of the rows before it has been
+# generated, with a Checkpoint of where that is in the spreadsheet
+CHECKPOINT = 'checkpoint'
+
+# The last source_row generated, and the byte offset of the row after it
+Checkpoint = namedtuple('Checkpoint', ['source_row', 'offset'])
+
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Seconds between saved checkpoints
+CHECKPOINT_INTERVAL = 1.0
+
+resume_option = click.option('--resume', 'resume', is_flag=True,
+                             help='Carry on from the last checkpoint of a run that stopped')
+
+class Checkpoints:
+  """Saves how far a run has got in its output directory, so a run that
+     stops can be resumed.
+
+  A checkpoint records the position in the spreadsheet and the size of each
+  output file, once they've been flushed, along with the options that decide
+  what's written. It's removed when the run finishes."""
+
+  def __init__(self, output_dir, input_path, options=None):
+    self.path = join(output_dir, CHECKPOINT_FILE)
+    self.input = input_identity(input_path)
+    # As they'll be loaded, so they compare equal
+    self.options = json.loads(json.dumps(options or {}))
+    self.saved = None
+    self.saved_at = time.monotonic()
+
+  def load(self):
+    """Returns the Checkpoint and output file sizes to resume from"""
+
+    try:
+      with open(self.path) as f:
+        saved = json.load(f)
+    except FileNotFoundError:
+      raise click.ClickException(f'There is no checkpoint to resume from in {self.path}')
+
+    if saved['input'] != self.input:
+      raise click.ClickException('The spreadsheet has changed since the checkpoint was saved, '
+                                 'so the run has to start again')
+    saved_options = saved.get('options', {})
+    changed = sorted(name for name in {*self.options, *saved_options}
+                     if self.options.get(name) != saved_options.get(name))
+    if changed:
+      raise click.ClickException(f"{', '.join(changed)} changed since the checkpoint was saved, "
+                                 'resume with the same options or start again')
+    self.saved = Checkpoint(*saved['checkpoint'])
+    return self.saved, saved['sizes']
+
+  def save(self, checkpoint, sinks, state=None):
+    """Saves checkpoint, if one hasn't been saved for CHECKPOINT_INTERVAL"""
+
+    if time.monotonic() - self.saved_at < CHECKPOINT_INTERVAL:
+      return
+
+    for sink in sinks.values():
+      sink.flush()
+    if state:
+      state.checkpoint()
+
+    saved = {'input': self.input,
+             'options': self.options,
+             'checkpoint': checkpoint,
+             'sizes': { name: sink.sizes() for name, sink in sinks.items() }}
+    with open(f'{self.path}.tmp', 'w') as f:
+      json.dump(saved, f)
+    os.replace(f'{self.path}.tmp', self.path)
+    self.saved = checkpoint
+    self.saved_at = time.monotonic()
+
+  def remove(self):
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+def input_identity(path):
+  """Where path is, and enough to tell if it's changed"""
+
+  stat = os.stat(path)
+  return {'path': abspath(path), 'size': stat.st_size, 'modified': stat.st_mtime}
@@ -1,15 +1,58 @@
+import importlib
+
 import click
-import petl as etl
 
-from .prepare_contacts import prepare_contacts
-from .prepare_calls import prepare_calls
+from . import profiling
+
+# Command name => (module, attribute, short help). Commands are imported
+# when they're run, so --help and short runs don't pay for modules they
+# don't use.
+COMMANDS = {
+  'prepare-contacts': ('beacon.prepare_contacts', 'prepare_contacts',
+                       'Extracts core contact fields from a GDS file.'),
+  'prepare-calls': ('beacon.prepare_calls', 'prepare_calls',
+                    'Prepares call log records for import.'),
+  'load-contacts': ('beacon.load', 'load_contacts',
+                    'Prepares contacts and imports them.'),
+  'load-calls': ('beacon.load', 'load_calls',
+                 'Prepares call log records and imports them.'),
+  'load-prepared': ('beacon.load', 'load_prepared',
+                    'Imports a stream from prepare-calls.'),
+  'resume-import': ('beacon.load', 'resume_import',
+                    'Carries on with a failed batched import.'),
+  'index-contacts': ('beacon.contact_index', 'index_contacts',
+                     'Builds a contact index for --contact-index.'),
+  'batch': ('beacon.batch', 'batch',
+            'Runs the jobs in a manifest in one process.')
+}
+
+class LazyGroup(click.Group):
+  """A group whose commands are imported from COMMANDS when they're looked up"""
+
+  def list_commands(self, ctx):
+    return sorted([*COMMANDS, *self.commands])
+
+  def get_command(self, ctx, name):
+    if name in COMMANDS:
+      module, attribute, _ = COMMANDS[name]
+      return getattr(importlib.import_module(module), attribute)
+    return super().get_command(ctx, name)
 
-@click.group()
-def main():
-  pass
+  def format_commands(self, ctx, formatter):
+    rows = [(name, COMMANDS[name][2] if name in COMMANDS
+                   else self.commands[name].get_short_help_str())
+            for name in self.list_commands(ctx)]
+    with formatter.section('Commands'):
+      formatter.write_dl(rows)
 
-main.add_command(prepare_contacts)
-main.add_command(prepare_calls)
+@click.group(cls=LazyGroup)
+@click.option('--profile', 'profile', is_flag=True,
+              help='Write row counts, timings and peak memory per stage and output to profile.json')
+@click.pass_context
+def main(ctx, profile):
+  if profile:
+    profiler = profiling.start(ctx.invoked_subcommand)
+    ctx.call_on_close(lambda: click.echo(f'Profile written to {profiler.write_report()}', err=True))
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,109 @@
+from functools import partial
+from operator import attrgetter
+
+import click
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+from .helpers import try_convert
+from . import rules
+from .rules import Outcome, TRIAGE_COMPLETING_CONTACTS, FOOD_OUTCOMES, OTHER_OUTCOMES
+from .prepare_calls import (Classification, parse_food_priority, parse_callback_date,
+                            COMPLETED_FOOD_PRIORITIES, COMPLEX_NEED_FIELDS,
+                            SIMPLE_NEED_FIELDS, MISC_NEED_FIELDS)
+
+# The columns the rules read
+COLUMNS = ['latest_attempt_date', 'was_contact_made', 'outcome', 'food_priority',
+           'callback_date', 'book_weekly_food_delivery', 'addl_medication_prescriptions',
+           'addl_mental_wellbeing', 'addl_financial', *COMPLEX_NEED_FIELDS,
+           *SIMPLE_NEED_FIELDS, *MISC_NEED_FIELDS]
+
+def require_numpy():
+  if np is None:
+    raise click.ClickException('The columnar engine requires numpy, '
+                               'install with: pip3 install "beacon-data-importer[columnar]"')
+
+def classify_rows(rows, complex_needs_user, simple_needs_user, call_log_review_user):
+  """Same result as prepare_calls.classify_rows(), but evaluates each rule as
+     a mask over a whole column of the chunk at once.
+
+  Rules that parse or normalize a value are run once per distinct value in
+  the column, which suits the low cardinality of these columns, and their
+  results broadcast back to the rows with an index array."""
+
+  require_numpy()
+  if not rows:
+    return []
+
+  table = np.array(list(map(attrgetter(*COLUMNS), rows)), dtype=object)
+  columns = dict(zip(COLUMNS, table.T))
+  def filled(*keys):
+    return np.logical_or.reduce([columns[key].astype(bool) for key in keys])
+
+  latest_attempt_date = columns['latest_attempt_date']
+  outcomes, outcome_inverse = map_distinct(columns['outcome'], rules.outcome)
+  def outcome_in(wanted):
+    return np.array([outcome in wanted for outcome in outcomes], dtype=bool)[outcome_inverse]
+
+  def holds(key, rule):
+    results, inverse = map_distinct(columns[key], rule)
+    return results.astype(bool)[inverse]
+
+  triage_completed = holds('was_contact_made',
+                           lambda value: rules.contact(value) in TRIAGE_COMPLETING_CONTACTS)
+
+  food_priorities, food_priority_inverse = map_distinct(columns['food_priority'],
+                                                        partial(try_convert, parse_food_priority))
+  food_priority = food_priorities[food_priority_inverse]
+  food_completed = np.array([priority in COMPLETED_FOOD_PRIORITIES
+                             for priority in food_priorities], dtype=bool)[food_priority_inverse]
+  needs_food = outcome_in(FOOD_OUTCOMES) | filled('food_priority')
+
+  callback_dates, callback_date_inverse = map_distinct(columns['callback_date'],
+                                                       partial(try_convert, parse_callback_date))
+  callback_date = callback_dates[callback_date_inverse]
+  needs_callback = (callback_dates.astype(bool)[callback_date_inverse]
+                    | needs_food
+                    | (columns['book_weekly_food_delivery'] == True)
+                    | outcome_in({Outcome.CALL_BACK}))
+
+  complex_need = filled(*COMPLEX_NEED_FIELDS)
+  simple_need = filled(*SIMPLE_NEED_FIELDS)
+  needs_other_support = (outcome_in(OTHER_OUTCOMES)
+                         | complex_need
+                         | simple_need
+                         | filled(*MISC_NEED_FIELDS))
+  other_need_user = np.select([complex_need, simple_need],
+                              [complex_needs_user, simple_needs_user],
+                              call_log_review_user)
+
+  return list(map(Classification._make, zip(
+    np.where(triage_completed, latest_attempt_date, None).tolist(),
+    needs_food.tolist(),
+    food_priority.tolist(),
+    np.where(food_completed, latest_attempt_date, None).tolist(),
+    callback_date.tolist(),
+    needs_callback.tolist(),
+    filled('addl_medication_prescriptions').tolist(),
+    filled('addl_mental_wellbeing').tolist(),
+    filled('addl_financial').tolist(),
+    needs_other_support.tolist(),
+    other_need_user.tolist()
+  )))
+
+def map_distinct(values, func):
+  """Applies func once per distinct value. Returns the results, by distinct
+     value, and the inverse index that broadcasts them back, so
+     results[inverse] is func of every value."""
+
+  # A dict of the distinct values numbers them in C, without sorting, which
+  # is faster than np.unique() for a few distinct strings
+  values = values.tolist()
+  codes = { value: code for code, value in enumerate(dict.fromkeys(values)) }
+  inverse = np.fromiter(map(codes.__getitem__, values), np.intp, len(values))
+  results = np.empty(len(codes), dtype=object)
+  results[:] = [func(value) for value in codes]
+  return results, inverse
@@ -0,0 +1,49 @@
+class RowComposer:
+  """Composes the '<label>: <value>' text of a row, for the labelled fields of
+     a header map.
+
+  The labelled fields are worked out once, up front. lines() strips and
+  formats the values of a row once, and the result is shared by every body
+  and description composed from that row with compose()."""
+
+  def __init__(self, fields):
+    self.labels = [(key, value['label'])
+                   for key, value in fields.items()
+                   if value['label']]
+
+  def lines(self, row):
+    """Returns {key: line} for the non-blank labelled values of a record, in
+       field order"""
+
+    lines = {}
+    for key, label in self.labels:
+      value = getattr(row, key)
+      if value:
+        value = value.strip()
+        if value:
+          lines[key] = f'{label}: {value}'
+    return lines
+
+  def replace(self, lines, **values):
+    """Returns a copy of lines with the given fields' values swapped in"""
+
+    replaced = {}
+    for key, label in self.labels:
+      if key not in values:
+        if key in lines:
+          replaced[key] = lines[key]
+        continue
+
+      value = values[key]
+      if value and value.strip():
+        replaced[key] = f'{label}: {value.strip()}'
+    return replaced
+
+def compose(lines, prefix_lines=None, keys=None):
+  selected = [line for key, line in lines.items()
+              if keys is None or key in keys]
+
+  if prefix_lines:
+    selected = prefix_lines + selected
+
+  return '\n'.join(selected)
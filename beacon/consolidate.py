@@ -0,0 +1,100 @@
+import heapq
+import marshal
+import tempfile
+from itertools import groupby
+
+import click
+
+# Rows sorted in memory at a time. Past this, sorted runs are spilled to
+# temporary files and merged, so memory is bounded by the run size rather
+# than the size of the call log.
+RUN_SIZE = 100000
+
+# Rows written and read back at a time from each run on disk
+BLOCK_SIZE = 1000
+
+consolidate_option = click.option('--consolidate', 'consolidate', is_flag=True,
+                                  help='Prepare one set of needs per contact, from their latest '
+                                       'call log row with blanks filled in from earlier rows')
+
+class Consolidation:
+  """Merges the call log rows of each contact into one, with an external
+     sort by contact and attempt.
+
+  The latest attempt of a contact wins, and the fields to fill that it
+  leaves blank are taken from the latest earlier row that has them, as the
+  import does for profile updates. Other fields are the latest attempt's. Sorted runs are spilled to temporary files, so only run_size rows
+  are held at once, and merged a contact at a time."""
+
+  def __init__(self, run_size=RUN_SIZE):
+    self.run_size = run_size
+    self.row_count = 0
+    self.contact_count = 0
+    self.spilled_runs = 0
+
+  def consolidate(self, rows, key, fill):
+    """Yields a (source_row, values) pair per contact from (source_row,
+       values) rows, in contact order. key(values) returns a tuple of the
+       contact and what orders their attempts, or None for rows that can't
+       be ordered, which are passed through as they are read. fill is the
+       indexes of the values that are filled from earlier rows."""
+
+    runs, run = [], []
+    try:
+      for source_row, values in rows:
+        attempt = key(values)
+        if attempt is None:
+          yield source_row, values
+          continue
+        self.row_count += 1
+        run.append((*attempt, source_row, values))
+        if len(run) >= self.run_size:
+          runs.append(spill(run))
+          run = []
+      run.sort()
+      self.spilled_runs = len(runs)
+
+      records = heapq.merge(run, *(read_run(file) for file in runs))
+      for _, contact_records in groupby(records, key=lambda record: record[0]):
+        *earlier, (*_, source_row, values) = contact_records
+        self.contact_count += 1
+        yield source_row, merge_rows([record[-1] for record in earlier], values, fill)
+    finally:
+      for file in runs:
+        file.close()
+
+def spill(run):
+  """Writes run, sorted, to a temporary file"""
+
+  run.sort()
+  file = tempfile.TemporaryFile('w+b')
+  for start in range(0, len(run), BLOCK_SIZE):
+    # marshal.load() reads a file in small pieces, so blocks are read whole
+    # by their length and then loaded
+    block = marshal.dumps(run[start:start + BLOCK_SIZE])
+    file.write(len(block).to_bytes(8, 'little'))
+    file.write(block)
+  file.seek(0)
+  return file
+
+def read_run(file):
+  while True:
+    length = file.read(8)
+    if not length:
+      return
+    yield from marshal.loads(file.read(int.from_bytes(length, 'little')))
+
+def merge_rows(earlier, latest, fill):
+  """latest, with its blank values at the indexes in fill filled from the
+     last of earlier that has them"""
+
+  if not earlier:
+    return latest
+
+  merged = list(latest)
+  for index in fill:
+    value = merged[index]
+    if not value.strip():
+      merged[index] = next((values[index] for values in reversed(earlier)
+                            if values[index].strip()), value)
+  return tuple(merged)
@@ -0,0 +1,108 @@
+import csv
+import hashlib
+import io
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+
+import click
+
+from .reader import INPUT_PATH, open_input
+
+# Leads every index file, with the version of its layout
+MAGIC = b'BCNIDX01'
+
+contact_index_option = click.option('--contact-index', 'contact_index_path',
+                                    type=click.Path(exists=True, dir_okay=False),
+                                    help='Skip rows for contacts that aren\'t in this index, '
+                                         'from index-contacts')
+
+def key(nhs_number):
+  """A 64 bit hash of nhs_number. The import scripts join on the exact text,
+     so the index does too, and a collision only keeps a row that would
+     have been dropped at import anyway."""
+
+  return int.from_bytes(hashlib.blake2b(nhs_number.encode(), digest_size=8).digest(), 'little')
+
+class ContactIndex:
+  """The NHS numbers of the contacts in the database, as a memory mapped,
+     sorted array of their keys. Looking one up is a binary search of the
+     file, so only the pages it touches are read."""
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      if f.read(len(MAGIC)) != MAGIC:
+        raise click.ClickException(f'{path} isn\'t a contact index, build one with index-contacts')
+      if (os.fstat(f.fileno()).st_size - len(MAGIC)) % 8:
+        raise click.ClickException(f'{path} is truncated, build it again with index-contacts')
+      self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.keys = memoryview(self.map)[len(MAGIC):].cast('Q')
+    self.skipped_count = 0
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __contains__(self, nhs_number):
+    nhs_number_key = key(nhs_number)
+    i = bisect_left(self.keys, nhs_number_key)
+    return i < len(self.keys) and self.keys[i] == nhs_number_key
+
+  def select_known(self, rows, nhs_number_index):
+    """Yields the (source_row, values) rows whose NHS number, at
+       nhs_number_index of their values, is in the index, and counts the
+       rest in skipped_count"""
+
+    for row in rows:
+      if row[1][nhs_number_index] in self:
+        yield row
+      else:
+        self.skipped_count += 1
+
+  def close(self):
+    self.keys.release()
+    self.map.close()
+
+def write_index(path, nhs_numbers):
+  """Writes the index of nhs_numbers to path, returning how many distinct
+     NHS numbers it holds"""
+
+  keys = array('Q', sorted({ key(nhs_number) for nhs_number in nhs_numbers }))
+  with open(f'{path}.tmp', 'wb') as f:
+    f.write(MAGIC)
+    keys.tofile(f)
+  os.replace(f'{path}.tmp', path)
+  return len(keys)
+
+def read_nhs_numbers(path):
+  """Yields the NHS numbers in a prepare-contacts CSV, or in a COPY export of
+     contacts(nhs_number) without a header"""
+
+  # Only the NHS numbers are needed, and they're ASCII
+  with io.TextIOWrapper(open_input(path), encoding='utf-8', errors='replace', newline='') as f:
+    rows = csv.reader(f)
+    first = next(rows, None)
+    if not first:
+      return
+    if 'nhs_number' in first:
+      index = first.index('nhs_number')
+    else:
+      index = 0
+      yield first[0]
+    for row in rows:
+      if row:
+        yield row[index]
+
+@click.command()
+@click.argument('contacts_paths', nargs=-1, required=True, type=INPUT_PATH)
+@click.option('-o', '--output', 'output_path', required=True,
+              type=click.Path(dir_okay=False, writable=True))
+def index_contacts(contacts_paths, output_path):
+  """Builds a contact index for --contact-index, from prepare-contacts
+     outputs or COPY exports of contacts(nhs_number), any of which can be -
+     for stdin and compressed"""
+
+  nhs_numbers = (nhs_number for path in contacts_paths for nhs_number in read_nhs_numbers(path))
+  count = write_index(output_path, nhs_numbers)
+  click.echo(f'Indexed {count} contacts in {output_path}', err=True)
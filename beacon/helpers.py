@@ -1,11 +1,63 @@
+import re
 import json
-from datetime import datetime
+from json.encoder import encode_basestring_ascii as encode_json_string
+from datetime import date, datetime
+from functools import lru_cache
 
+# Date columns only hold a few hundred distinct values, so parsed dates are
+# cached on the raw string
+DATE_CACHE_SIZE = 4096
+
+# Shapes of the date formats we see in spreadsheets, parsed without strptime
+DATE_SHAPES = {
+  '%d/%m/%Y': re.compile(r'([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})'),
+  '%d.%m.%y': re.compile(r'([0-9]{1,2})\.([0-9]{1,2})\.([0-9]{2})')
+}
+
+# Same result as json.dumps(dict(zip(keys, row))). keys must be a tuple.
 def serialize_row(row, keys):
-  return json.dumps(dict(zip(keys, row)))
+  return row_serializer(keys)(row)
+
+@lru_cache(maxsize=16)
+def row_serializer(keys):
+  """Returns a function that serializes rows of strings as JSON objects with
+     the given keys. Keys are encoded once, with their separators, and only
+     the values are encoded per row."""
+
+  if len(set(keys)) < len(keys):
+    # Later values of duplicate keys replace earlier ones, so go via a dict
+    return lambda row: json.dumps(dict(zip(keys, row)))
+
+  prefixes = [f'{encode_json_string(key)}: ' for key in keys]
+  def serialize(row):
+    return '{' + ', '.join([prefix + encode_json_string(value)
+                            for prefix, value in zip(prefixes, row)]) + '}'
+  return serialize
 
 # '31/01/1980' => '1980-03-31'
 def parse_date(value):
-  input_format = '%d/%m/%Y'
-  return datetime.strptime(value, input_format) \
-                 .date().isoformat()
+  return parse_date_as(value, '%d/%m/%Y')
+
+# Same result and errors as datetime.strptime(value, input_format), as an
+# ISO date string
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_as(value, input_format):
+  match = DATE_SHAPES[input_format].fullmatch(value) \
+          if input_format in DATE_SHAPES else None
+  if not match:
+    return datetime.strptime(value, input_format) \
+                   .date().isoformat()
+
+  day, month, year = map(int, match.groups())
+  if input_format.endswith('%y'):
+    # strptime's two digit year pivot
+    year += 1900 if year >= 69 else 2000
+
+  return date(year, month, day).isoformat()
+
+# Mirrors petl's convert(), where a failing converter yields None
+def try_convert(converter, value):
+  try:
+    return converter(value)
+  except Exception:
+    return None
@@ -0,0 +1,311 @@
+import csv
+import io
+from os.path import dirname, join
+
+import click
+
+from .prepare_calls import (OUTPUTS, generate_outputs, needs_user_options,
+                            engine_option, incremental_option)
+from . import profiling
+from .state import ImportState
+from .rules import rules_option, load_rules
+from .contact_index import ContactIndex, contact_index_option
+from .consolidate import Consolidation, consolidate_option
+from .stream import read_stream
+from .reader import INPUT_PATH
+from .prepare_contacts import CONTACT_FIELDS, generate_contacts
+from .parallel import workers_option
+
+SQL_DIR = join(dirname(__file__), 'sql')
+
+# A batch size that puts every contact in one batch
+ALL_CONTACTS = 1 << 62
+
+# Output name => temporary loading table
+TMP_TABLES = {
+  'original_triage_needs': 'tmp_original_triage_needs',
+  'original_triage_notes': 'tmp_original_triage_notes',
+  'food_needs': 'tmp_identified_needs',
+  'callback_needs': 'tmp_identified_needs',
+  'remaining_needs': 'tmp_identified_needs',
+  'contact_profile_updates': 'tmp_contact_profile_updates'
+}
+
+IMPORT_SCRIPTS = ['import_original_triage_needs_and_notes.sql',
+                  'import_identified_needs.sql',
+                  'import_contact_profile_updates.sql']
+
+database_url_option = click.option('-d', '--database-url', 'database_url',
+                                   envvar='DATABASE_URL', required=True,
+                                   help='Defaults to $DATABASE_URL')
+batch_size_option = click.option('-b', '--batch-size', 'batch_size', default=10000,
+                                 show_default=True, type=click.IntRange(min=1),
+                                 help='Rows buffered per table before they are copied')
+import_batch_size_option = click.option('--import-batch-size', 'import_batch_size',
+                                        type=click.IntRange(min=1),
+                                        help='Import this many contacts at a time, committing '
+                                             'each batch, instead of in one transaction')
+keep_tmp_tables_option = click.option('--keep-tmp-tables', 'keep_tmp_tables', is_flag=True,
+                                      help='Leave the temporary loading tables in place '
+                                           'for inspection')
+
+@click.command()
+@click.argument('calls_file_path', type=INPUT_PATH)
+@database_url_option
+@needs_user_options
+@workers_option
+@batch_size_option
+@engine_option
+@incremental_option
+@import_batch_size_option
+@keep_tmp_tables_option
+@rules_option
+@contact_index_option
+@consolidate_option
+def load_calls(calls_file_path, database_url, workers, batch_size, engine,
+               state_path, import_batch_size, keep_tmp_tables, rules_path,
+               contact_index_path, consolidate, **users):
+  """Prepares call log records and imports them straight into the database,
+     in a single transaction unless --import-batch-size is given"""
+
+  contact_index = ContactIndex(contact_index_path) if contact_index_path else None
+  consolidation = Consolidation() if consolidate else None
+  state = ImportState(state_path) if state_path else None
+  outputs = generate_outputs(calls_file_path, workers, state=state, engine=engine,
+                             vocabularies=load_rules(rules_path),
+                             contact_index=contact_index, consolidation=consolidation,
+                             **users)
+  import_outputs(outputs, database_url, batch_size, import_batch_size, keep_tmp_tables, state)
+
+  if contact_index is not None:
+    contact_index.close()
+    click.echo(f'Skipped {contact_index.skipped_count} rows for contacts that '
+               f'aren\'t in {contact_index_path}', err=True)
+
+  if consolidation:
+    click.echo(f'Consolidated {consolidation.row_count} rows into '
+               f'{consolidation.contact_count} contacts', err=True)
+
+  # Only once the import has been committed
+  if state:
+    state.commit()
+    state.close()
+    click.echo(f'Skipped {state.skipped_count} previously imported rows', err=True)
+    if state.changed_count:
+      click.echo(f'Skipped {state.changed_count} previously imported rows that have been '
+                 'edited since, which aren\'t imported again', err=True)
+
+@click.command()
+@click.argument('prepared_path', type=INPUT_PATH)
+@database_url_option
+@batch_size_option
+@import_batch_size_option
+@keep_tmp_tables_option
+def load_prepared(prepared_path, database_url, batch_size, import_batch_size, keep_tmp_tables):
+  """Imports the call log stream written by prepare-calls --output-dir -,
+     from prepared_path or - for stdin"""
+
+  outputs = read_stream(prepared_path, OUTPUTS)
+  import_outputs(outputs, database_url, batch_size, import_batch_size, keep_tmp_tables)
+
+def import_outputs(outputs, database_url, batch_size, import_batch_size, keep_tmp_tables,
+                   state=None):
+  """Copies prepared call log outputs into the temporary loading tables and
+     imports them, in a single transaction unless import_batch_size is given.
+     Then the rows of each batch are recorded in state as it's committed."""
+
+  connection = connect(database_url)
+  try:
+    with connection, connection.cursor() as cursor:
+      run_script(cursor, 'create_tmp_tables.sql')
+      copy_outputs(cursor, outputs, batch_size)
+      run_script(cursor, 'prepare_import.sql')
+
+      if not import_batch_size:
+        run_import_scripts(cursor)
+        if not keep_tmp_tables:
+          drop_tmp_tables(cursor)
+
+    # The loaded tmp tables were committed above, and each batch is
+    # committed as it's imported
+    if import_batch_size:
+      import_in_batches(connection, import_batch_size, state)
+      if not keep_tmp_tables:
+        with connection, connection.cursor() as cursor:
+          drop_tmp_tables(cursor)
+  finally:
+    connection.close()
+
+@click.command()
+@click.argument('gds_file_path', type=INPUT_PATH)
+@database_url_option
+@workers_option
+@batch_size_option
+def load_contacts(gds_file_path, database_url, workers, batch_size):
+  """Prepares contacts from gds_file_path and copies them straight into the
+     contacts table, in a single transaction"""
+
+  contacts = generate_contacts(gds_file_path, workers)
+  connection = connect(database_url)
+  try:
+    with connection, connection.cursor() as cursor:
+      sink = CopySink(cursor, 'contacts', CONTACT_FIELDS, batch_size)
+      sink = profiling.timed_sink('contacts', sink, CONTACT_FIELDS)
+      for contact in contacts:
+        sink.write(contact)
+      sink.close()
+      click.echo(f'Copied {sink.row_count} rows into contacts', err=True)
+  finally:
+    connection.close()
+
+def copy_outputs(cursor, outputs, batch_size):
+  """Copies the prepared call log outputs into the temporary loading tables"""
+
+  sinks = { name: profiling.timed_sink(name,
+                                       CopySink(cursor, table, OUTPUTS[name][0], batch_size),
+                                       OUTPUTS[name][0])
+            for name, table in TMP_TABLES.items() }
+  rejected_count = 0
+  for name, _, values in outputs:
+    if name in sinks:
+      sinks[name].write(values)
+    elif name == 'rejects':
+      rejected_count += 1
+  for name, sink in sinks.items():
+    sink.close()
+    click.echo(f'Copied {sink.row_count} {name} rows into {sink.table}', err=True)
+  if rejected_count:
+    click.echo(f'Rejected {rejected_count} rows, prepare-calls writes them '
+               'to rejects.csv with the reasons', err=True)
+
+def run_import_scripts(cursor):
+  for script in IMPORT_SCRIPTS:
+    run_script(cursor, script)
+
+def import_in_batches(connection, import_batch_size=None, state=None):
+  """Runs the import scripts over ranges of import_batch_size nhs_numbers,
+     or all of them at once without one, committing each range.
+
+  A batch's rows are deleted from the tmp tables as part of its transaction,
+  and recorded in state once it's committed. If one fails, earlier ranges
+  stay imported, and the tmp tables are kept with only the rows that
+  weren't, for resume-import to carry on with."""
+
+  with connection, connection.cursor() as cursor:
+    cursor.execute('''
+      SELECT min(nhs_number), max(nhs_number)
+      FROM (SELECT nhs_number,
+                   (row_number() OVER (ORDER BY nhs_number) - 1) / %s AS batch
+            FROM (SELECT DISTINCT nhs_number FROM tmp_original_triage_needs) AS nhs_numbers
+           ) AS batches
+      GROUP BY batch
+      ORDER BY batch
+    ''', (import_batch_size or ALL_CONTACTS,))
+    batches = cursor.fetchall()
+
+  for number, (first_nhs_number, last_nhs_number) in enumerate(batches, 1):
+    try:
+      with connection, connection.cursor() as cursor:
+        cursor.execute('UPDATE tmp_import_batch SET first_nhs_number = %s, last_nhs_number = %s',
+                       (first_nhs_number, last_nhs_number))
+        run_import_scripts(cursor)
+        if state:
+          cursor.execute('''
+            SELECT DISTINCT nhs_number FROM tmp_original_triage_needs
+            WHERE nhs_number BETWEEN %s AND %s
+          ''', (first_nhs_number, last_nhs_number))
+          nhs_numbers = [nhs_number for nhs_number, in cursor]
+        run_script(cursor, 'finish_import_batch.sql')
+    except Exception:
+      click.echo(f'Imported {number - 1} of {len(batches)} batches before failing, '
+                 f'the rest are still in the tmp tables from {first_nhs_number}. '
+                 'Run resume-import to carry on from there.', err=True)
+      raise
+    if state:
+      state.commit_contacts(nhs_numbers)
+    click.echo(f'Imported batch {number} of {len(batches)}: '
+               f'nhs_numbers {first_nhs_number} to {last_nhs_number}', err=True)
+
+@click.command()
+@database_url_option
+@import_batch_size_option
+@keep_tmp_tables_option
+@click.option('--incremental', 'state_path',
+              type=click.Path(exists=True, dir_okay=False, writable=True),
+              help='The state file of the load-calls --incremental run that failed, '
+                   'to record its rows as they\'re imported')
+def resume_import(database_url, import_batch_size, keep_tmp_tables, state_path):
+  """Carries on with a load-calls or load-prepared --import-batch-size import
+     that failed, from the rows it left in the tmp tables"""
+
+  state = ImportState(state_path, resume=True) if state_path else None
+  connection = connect(database_url)
+  try:
+    with connection, connection.cursor() as cursor:
+      cursor.execute("SELECT to_regclass('tmp_import_batch')")
+      if cursor.fetchone()[0] is None:
+        raise click.ClickException('There are no tmp tables to carry on from, '
+                                   'only a failed --import-batch-size import leaves them')
+
+    import_in_batches(connection, import_batch_size, state)
+    if not keep_tmp_tables:
+      with connection, connection.cursor() as cursor:
+        drop_tmp_tables(cursor)
+  finally:
+    connection.close()
+
+  if state:
+    state.commit()
+    state.close()
+
+def drop_tmp_tables(cursor):
+  cursor.execute(f"DROP TABLE {', '.join(sorted({*TMP_TABLES.values(), 'tmp_import_batch'}))}")
+
+class CopySink:
+  """Streams rows into a table over the COPY protocol, in batches.
+
+  Rows are buffered as CSV, the same format as the prepared files, and each
+  full batch is copied before any more rows are accepted. That keeps memory
+  bounded by the batch size however large the input is."""
+
+  def __init__(self, cursor, table, columns, batch_size):
+    self.cursor = cursor
+    self.table = table
+    self.statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    self.batch_size = batch_size
+    self.row_count = 0
+    self._new_batch()
+
+  def _new_batch(self):
+    self.buffer = io.StringIO()
+    self.writer = csv.writer(self.buffer)
+    self.batch_count = 0
+
+  def write(self, values):
+    self.writer.writerow(values)
+    self.batch_count += 1
+    if self.batch_count >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if self.batch_count:
+      self.buffer.seek(0)
+      self.cursor.copy_expert(self.statement, self.buffer)
+      self.row_count += self.batch_count
+    self._new_batch()
+
+  def close(self):
+    self.flush()
+
+def connect(database_url):
+  try:
+    import psycopg2
+  except ImportError:
+    raise click.ClickException('Loading into the database requires psycopg2, '
+                               'install with: pip3 install "beacon-data-importer[postgres]"')
+
+  return psycopg2.connect(database_url)
+
+def run_script(cursor, file_name):
+  with open(join(SQL_DIR, file_name)) as f:
+    cursor.execute(f.read())
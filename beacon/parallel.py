@@ -0,0 +1,40 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import click
+
+# Rows handed to a worker at a time
+CHUNK_SIZE = 1000
+
+workers_option = click.option('-w', '--workers', 'workers', default=1, show_default=True,
+                              type=click.IntRange(min=1),
+                              help='Number of processes to prepare rows with')
+
+def chunked(iterable, size=CHUNK_SIZE):
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if not chunk:
+      return
+    yield chunk
+
+def ordered_map(func, iterable, workers=1, initializer=None, initargs=()):
+  """Like map(), but spreads the calls over a pool of worker processes when
+     workers > 1. Results are yielded in input order, and only a few items
+     per worker are in flight at once so memory stays bounded. initializer
+     is called with initargs in each worker as it starts."""
+
+  if workers <= 1:
+    yield from map(func, iterable)
+    return
+
+  with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as executor:
+    pending = deque()
+    for item in iterable:
+      pending.append(executor.submit(func, item))
+      if len(pending) >= workers * 2:
+        yield pending.popleft().result()
+
+    while pending:
+      yield pending.popleft().result()
@@ -1,14 +1,32 @@
 import re
 import json
-from datetime import date, datetime, timedelta
-from functools import partial
-from os.path import join
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache, partial
+from itertools import chain
+from os.path import abspath, basename, join
 
 import click
-import petl as etl
 
-from .helpers import serialize_row, parse_date
+from .helpers import (serialize_row, parse_date, parse_date_as, try_convert,
+                      DATE_CACHE_SIZE)
 from .calls_header_map import header_map, rename_map
+from .reader import INPUT_PATH, read_columns
+from .composer import RowComposer, compose
+from .sinks import (format_option, compression_option, open_sink, output_path,
+                    format_bytes)
+from . import profiling
+from .state import ImportState
+from .checkpoint import CHECKPOINT, Checkpoint, Checkpoints, input_identity, resume_option
+from .stream import OutputStream
+from .contact_index import ContactIndex, contact_index_option
+from .consolidate import Consolidation, consolidate_option
+from .shards import (ShardedSink, check_open_files, max_rows_option, shards_option,
+                     write_manifest)
+from .parallel import chunked, ordered_map, workers_option
+from . import rules
+from .rules import (Outcome, TRIAGE_COMPLETING_CONTACTS, CONTACT_CALLS, FOOD_OUTCOMES,
+                    OTHER_OUTCOMES, rules_option, load_rules, use_rules)
 
 MSG_ORIGINAL_TRIAGE_NEED = '[Import]: Imported from call log spreadsheet'
 MSG_CALL_LOG_NOTE = '[Import]: Imported call log'
@@ -17,224 +35,592 @@ MSG_CALLBACK_NEED = '[Import]: Callback need created automatically because the i
 MSG_CLOSED_FOOD_NEED = '[Import]: Marked completed because priority 1 and 2 food needs were all met by the time the call log was imported'
 MSG_OTHER_NEED = '[Import]: Need created automatically because the imported call log had an "Other referral" or filled in "Additional support"'
 
-@click.command()
-@click.argument('calls_file_path')
-@click.option('-o', '--output-dir', 'output_dir', required=True,
-              type=click.Path(exists=True, file_okay=False, writable=True))
-@click.option('-fnu', '--food-needs-user', 'food_needs_user', required=True, type=int)
-@click.option('-cnu', '--complex-needs-user', 'complex_needs_user', required=True, type=int)
-@click.option('-snu', '--simple-needs-user', 'simple_needs_user', required=True, type=int)
-@click.option('-clru', '--call-log-review-user', 'call_log_review_user', required=True, type=int)
-def prepare_calls(calls_file_path, output_dir, food_needs_user,
-                  complex_needs_user, simple_needs_user, call_log_review_user):
-  """Prepares call log records for import"""
-
-  # Expected file is in 'windows-1252' file encoding
-  spreadsheet = (
-    etl.fromcsv(calls_file_path, encoding='windows-1252')
-    .rename(rename_map)
-    .select(lambda row: row['latest_attempt_date'])
-    .addfield('import_data', partial(serialize_row, keys=header_map.keys()))
-    .convert('latest_attempt_date', parse_date)
-    .addfield('created_at', lambda row: row['latest_attempt_date'])
-    .addfield('updated_at', lambda row: row['latest_attempt_date'])
-  )
-
-  needs_fields = ['nhs_number', 'category', 'name', 'created_at', 'updated_at']
-  notes_fields = ['nhs_number', 'category', 'body', 'created_at', 'updated_at']
-
-  original_triage_needs = (
-    spreadsheet
-    .addfield('category', 'phone triage')
-    .addfield('name', MSG_ORIGINAL_TRIAGE_NEED)
-    .addfield('completed_on', determine_triage_completion)
-    .cut(*needs_fields, 'completed_on')
-  )
-
-  generated_header = ['nhs_number', 'created_at', 'updated_at', 'category']
-  original_triage_call_notes = (
-    spreadsheet
-    .selectnotnone('was_contact_made')
-    .rowmapmany(generate_call_notes, header=generated_header)
-    .addfield('body', MSG_CALL_LOG_NOTE)
-    .cut(*notes_fields)
-  )
-
-  original_triage_import_notes = (
-    spreadsheet
-    .addfield('category', 'phone_import')
-    .addfield('body', partial(compose_body, fields=header_map))
-    .cut(*notes_fields, 'import_data')
-  )
-
-  food_needs = (
-    spreadsheet
-    .select(needs_food)
-    .addfield('category', 'groceries and cooked meals')
-    .convert('food_priority', parse_food_priority)
-    .addfield('supplemental_data', construct_supplemental_data)
-    .addfield('completed_on', determine_food_completion)
-    .addfield('user_id', food_needs_user)
-    .addfield('name', partial(compose_food_need_desc, fields=header_map))
-    .cut(*needs_fields, 'completed_on', 'supplemental_data', 'user_id')
-  )
-
-  callback_needs = (
-    spreadsheet
-    .convert('callback_date', parse_callback_date)
-    .select(needs_callback)
-    .addfield('category', 'phone triage')
-    .addfield('name', partial(compose_callback_need_desc, fields=header_map))
-    .addfield('start_on', determine_callback_start_date)
-    .cut(*needs_fields, 'start_on')
-  )
-
-  prescription_needs = (
-    spreadsheet
-    .select(lambda row: row['addl_medication_prescriptions'])
-    .addfield('category', 'prescription pickups')
-    .addfield('name', partial(compose_other_need_desc, fields=header_map))
-    .addfield('user_id', simple_needs_user)
-    .cut(*needs_fields, 'user_id')
-  )
-
-  mental_wellbeing_needs = (
-    spreadsheet
-    .select(lambda row: row['addl_mental_wellbeing'])
-    .addfield('category', 'physical and mental wellbeing')
-    .addfield('name', partial(compose_other_need_desc, fields=header_map))
-    .addfield('user_id', complex_needs_user)
-    .cut(*needs_fields, 'user_id')
-  )
-
-  financial_needs = (
-    spreadsheet
-    .select(lambda row: row['addl_financial'])
-    .addfield('category', 'financial support')
-    .addfield('name', partial(compose_other_need_desc, fields=header_map))
-    .addfield('user_id', complex_needs_user)
-    .cut(*needs_fields, 'user_id')
-  )
-
-  other_needs = (
-    spreadsheet
-    .select(needs_other_support)
-    .addfield('category', 'other')
-    .addfield('name', partial(compose_other_need_desc, fields=header_map))
-    .addfield('user_id', partial(determine_other_need_user,
-                                 complex_needs_user=complex_needs_user,
-                                 simple_needs_user=simple_needs_user,
-                                 call_log_review_user=call_log_review_user))
-    .cut(*needs_fields, 'user_id')
-  )
-
-  # TODO: prefix with [Import]
-  contact_profile_updates = (
-    spreadsheet
-    .addfield('additional_info', partial(compose_additional_info, fields=header_map))
-    .addfield('delivery_details', partial(compose_delivery_details, fields=header_map))
-    .addfield('dietary_details', compose_dietary_details)
-    .convert('has_covid_symptoms', parse_covid_symptoms)
-    .cut('nhs_number',
-         'additional_info',
-         'delivery_details',
-         'dietary_details',
-         'has_covid_symptoms')
-  )
-
-  # TODO: Improve implementation and readability of QA bits (currently loads all tables into memory)
-  # TODO: Consider adding stats to output somewhere for additional QA
-  lookups = {
-    'original_triage_needs': original_triage_needs.dictlookupone('nhs_number'),
-    'original_triage_call_notes': original_triage_call_notes.dictlookup('nhs_number'), # returns list
-    'food_needs': food_needs.dictlookupone('nhs_number'),
-    'callback_needs': callback_needs.dictlookupone('nhs_number'),
-    'remaining_needs': etl.cat(prescription_needs,
-                               mental_wellbeing_needs,
-                               financial_needs,
-                               other_needs).dictlookup('nhs_number') # returns list
-  }
-  quality_assurance = (
-    spreadsheet
-    .addfield('call_log', partial(compose_body, fields=header_map))
-    .addfield('original_triage_status', partial(qa_original_triage_status, lookups['original_triage_needs']))
-    .addfield('original_triage_call_notes', partial(qa_original_triage_call_notes, lookups['original_triage_call_notes']))
-    .addfield('food_need', partial(qa_food_need, lookups['food_needs']))
-    .addfield('callback_need', partial(qa_callback_need, lookups['callback_needs']))
-    .addfield('remaining_needs', partial(qa_remaining_needs, lookups['remaining_needs']))
-    .cut('nhs_number',
-         'latest_attempt_date',
-         'original_triage_status',
-         'original_triage_call_notes',
-         'food_need',
-         'callback_need',
-         'remaining_needs',
-         'call_log')
-  )
-
-  # Write files
-  quality_assurance.tocsv(join(output_dir, 'quality_assurance.csv'))
-  contact_profile_updates.tocsv(join(output_dir, 'contact_profile_updates.csv'))
-  original_triage_needs.tocsv(join(output_dir, 'original_triage_needs.csv'))
-
-  etl.cat(original_triage_import_notes, original_triage_call_notes) \
-     .tocsv(join(output_dir, 'original_triage_notes.csv'))
-
+composer = RowComposer(header_map)
+
+class CallRecord(namedtuple('CallRecord', [*header_map, 'import_data', 'source_row'])):
+  """A normalized call log row: the spreadsheet values in calls_header_map
+     order, with latest_attempt_date parsed, the original row serialized, and
+     the row's number in the spreadsheet, from 1 for the row after the
+     header.
+
+  Records are tuples, so a chunk of them is a fraction of the size of a dict
+  per row, and the outputs only hold the fields they add."""
+
+  __slots__ = ()
+
+  # Everything generated from a row is dated by its attempt
+  @property
+  def created_at(self):
+    return self.latest_attempt_date
+
+  updated_at = created_at
+
+LATEST_ATTEMPT_DATE_INDEX = CallRecord._fields.index('latest_attempt_date')
+LATEST_ATTEMPT_TIME_INDEX = CallRecord._fields.index('latest_attempt_time')
+NHS_NUMBER_INDEX = CallRecord._fields.index('nhs_number')
+# The fields that go into contact profile updates, which --consolidate fills
+# from a contact's earlier rows. The rest, which the rules read, are only
+# ever taken from the latest attempt.
+PROFILE_FIELDS = ['household_count', 'support_already_getting', 'notes', 'delivery_contact',
+                  'delivery_special_info', 'dietary_requirements', 'has_covid_symptoms']
+PROFILE_FIELD_INDEXES = [CallRecord._fields.index(field) for field in PROFILE_FIELDS]
+IMPORT_DATA_KEYS = tuple(header_map)
+
+# What the rules decide for a row, by classify_row() or in bulk by the
+# columnar engine
+Classification = namedtuple('Classification', ['triage_completed_on',
+                                               'needs_food',
+                                               'food_priority',
+                                               'food_completed_on',
+                                               'callback_date',
+                                               'needs_callback',
+                                               'needs_prescriptions',
+                                               'needs_mental_wellbeing',
+                                               'needs_financial',
+                                               'needs_other_support',
+                                               'other_need_user'])
+
+# was_contact_made and outcome are classified by the vocabularies in rules
+COMPLETED_FOOD_PRIORITIES = ['1', '2']
+
+# Additional support fields that make an 'other' need, by who it goes to
+COMPLEX_NEED_FIELDS = ['addl_adult_social_care', 'addl_children_services', 'addl_safeguarding']
+SIMPLE_NEED_FIELDS = ['addl_housing_waste', 'addl_medical_appt_transport', 'addl_referrals']
+MISC_NEED_FIELDS = ['addl_misc_other1', 'addl_misc_other2']
+
+NEEDS_FIELDS = ['nhs_number', 'category', 'name', 'created_at', 'updated_at']
+NOTES_FIELDS = ['nhs_number', 'category', 'body', 'created_at', 'updated_at']
+
+# Output file name => (header, number of tables concatenated into it).
+# source_row links notes to the triage need from the same call log row, and
+# orders the profile updates of a contact.
+OUTPUTS = {
+  'quality_assurance': (['nhs_number',
+                         'latest_attempt_date',
+                         'original_triage_status',
+                         'original_triage_call_notes',
+                         'food_need',
+                         'callback_need',
+                         'remaining_needs',
+                         'call_log'], 1),
+  'contact_profile_updates': (['nhs_number',
+                               'additional_info',
+                               'delivery_details',
+                               'dietary_details',
+                               'has_covid_symptoms',
+                               'source_row'], 1),
+  'original_triage_needs': ([*NEEDS_FIELDS, 'completed_on', 'source_row'], 1),
+  # import notes, then call notes
+  'original_triage_notes': ([*NOTES_FIELDS, 'import_data', 'source_row'], 2),
   # psql copy meta command hangs when importing fully combined needs file
-  food_needs.tocsv(join(output_dir, 'food_needs.csv'))
-  callback_needs.tocsv(join(output_dir, 'callback_needs.csv'))
+  'food_needs': ([*NEEDS_FIELDS, 'completed_on', 'supplemental_data', 'user_id'], 1),
+  'callback_needs': ([*NEEDS_FIELDS, 'start_on'], 1),
+  # prescription, mental wellbeing, financial, then other needs
+  'remaining_needs': ([*NEEDS_FIELDS, 'user_id'], 4),
+  # rows that failed, with the reason
+  'rejects': (['source_row', 'nhs_number', 'reason', 'import_data'], 1),
+}
+
+# Column types for the binary output formats, as in sql/create_tmp_tables.sql.
+# Other columns are text.
+COLUMN_TYPES = {
+  'latest_attempt_date': 'date',
+  'created_at': 'date',
+  'updated_at': 'date',
+  'completed_on': 'date',
+  'start_on': 'date',
+  'user_id': 'bigint',
+  'source_row': 'bigint',
+  'has_covid_symptoms': 'boolean'
+}
+
+def needs_user_options(command):
+  """Adds the options for the users that generated needs are assigned to"""
+
+  options = [
+    click.option('-fnu', '--food-needs-user', 'food_needs_user', required=True, type=int),
+    click.option('-cnu', '--complex-needs-user', 'complex_needs_user', required=True, type=int),
+    click.option('-snu', '--simple-needs-user', 'simple_needs_user', required=True, type=int),
+    click.option('-clru', '--call-log-review-user', 'call_log_review_user', required=True, type=int)
+  ]
+  for option in reversed(options):
+    command = option(command)
+  return command
+
+incremental_option = click.option('--incremental', 'state_path',
+                                  type=click.Path(dir_okay=False, writable=True),
+                                  help='Only prepare rows not recorded in this state file, then record them')
+
+engine_option = click.option('--engine', 'engine', default='rows', show_default=True,
+                             type=click.Choice(['rows', 'columnar']),
+                             help='Apply the classification rules a row at a time, '
+                                  'or as vectorized masks over each chunk (needs numpy)')
+
+class OutputDir(click.Path):
+  """A writable directory, or '-' for a stream on stdout"""
+
+  def __init__(self):
+    super().__init__(exists=True, file_okay=False, writable=True)
+
+  def convert(self, value, param, ctx):
+    return value if value == '-' else super().convert(value, param, ctx)
 
-  etl.cat(prescription_needs,
-          mental_wellbeing_needs,
-          financial_needs,
-          other_needs) \
-     .tocsv(join(output_dir, 'remaining_needs.csv'))
+@click.command()
+@click.argument('calls_file_path', type=INPUT_PATH)
+@click.option('-o', '--output-dir', 'output_dir', required=True, type=OutputDir(),
+              help='Or - to write every output to stdout, as one stream of JSON lines '
+                   'for load-prepared')
+@needs_user_options
+@workers_option
+@engine_option
+@incremental_option
+@format_option
+@compression_option
+@resume_option
+@rules_option
+@contact_index_option
+@consolidate_option
+@shards_option
+@max_rows_option
+def prepare_calls(calls_file_path, output_dir, workers, engine, state_path,
+                  output_format, compression, resume, rules_path, contact_index_path,
+                  consolidate, shards, max_rows_per_file, **users):
+  """Prepares call log records for import. calls_file_path can be - for
+     stdin, and compressed."""
+
+  stream = None
+  sharded = shards or max_rows_per_file
+  if output_dir == '-':
+    if output_format != 'csv':
+      raise click.ClickException('--format doesn\'t apply to the stream written by --output-dir -')
+    if sharded:
+      raise click.ClickException('--shards and --max-rows-per-file split files, so don\'t '
+                                 'apply to the stream written by --output-dir -')
+    stream = OutputStream(compression)
+  elif profiling.current():
+    profiling.current().report_dir = output_dir
+  if sharded:
+    check_open_files(shards or 1, OUTPUTS)
+
+  # What decides the outputs, which a resumed run has to share
+  options = {**users, 'engine': engine, 'compression': compression,
+             'incremental': abspath(state_path) if state_path else None,
+             'contact_index': input_identity(contact_index_path) if contact_index_path else None,
+             'rules': input_identity(rules_path) if rules_path else None}
+  # Only unsharded CSV files of a named spreadsheet can be cut back to a
+  # checkpoint, and consolidating reads all of it before anything is written
+  checkpoints = (Checkpoints(output_dir, calls_file_path, options)
+                 if (output_format == 'csv' and not stream and calls_file_path != '-'
+                     and not consolidate and not sharded)
+                 else None)
+  start, sizes = None, {}
+  if resume:
+    if consolidate:
+      raise click.ClickException('--resume doesn\'t work with --consolidate, which writes '
+                                 'nothing until the whole call log has been read')
+    if sharded:
+      raise click.ClickException('--resume doesn\'t work with --shards or --max-rows-per-file, '
+                                 'run again without --resume to write every shard')
+    if not checkpoints:
+      raise click.ClickException('--resume only works with --format csv files in an '
+                                 '--output-dir, from a named spreadsheet')
+    start, sizes = checkpoints.load()
+    click.echo(f'Resuming after row {start.source_row}', err=True)
+  elif checkpoints:
+    checkpoints.remove()
+
+  vocabularies = load_rules(rules_path)
+  contact_index = ContactIndex(contact_index_path) if contact_index_path else None
+  consolidation = Consolidation() if consolidate else None
+  state = ImportState(state_path, resume=resume) if state_path else None
+  outputs = generate_outputs(calls_file_path, workers, state=state, engine=engine,
+                             start=start, vocabularies=vocabularies,
+                             contact_index=contact_index, consolidation=consolidation,
+                             **users)
+  sinks, paths = {}, {}
+  for name, (header, parts) in OUTPUTS.items():
+    if stream:
+      path = paths[name] = name
+      sink = stream.sink(name, header)
+    elif sharded:
+      path = paths[name] = output_path(join(output_dir, f'{name}.*'), output_format, compression)
+      sink = ShardedSink(join(output_dir, name), header, parts, output_format, COLUMN_TYPES,
+                         compression, shards or 1, max_rows_per_file)
+    else:
+      path = paths[name] = output_path(join(output_dir, name), output_format, compression)
+      sink = open_sink(path, header, parts, output_format, COLUMN_TYPES, sizes.get(name),
+                       compression)
+    sinks[name] = profiling.timed_sink(basename(path), sink, header)
+
+  rejected_count = 0
+  try:
+    for name, part, values in outputs:
+      if name == CHECKPOINT:
+        if checkpoints:
+          checkpoints.save(values, sinks, state)
+        continue
+      if name == 'rejects':
+        rejected_count += 1
+      sinks[name].write(values, part)
+  except BaseException:
+    for sink in sinks.values():
+      sink.abort()
+    if checkpoints and checkpoints.saved:
+      click.echo(f'Stopped after a checkpoint at row {checkpoints.saved.source_row}, '
+                 'run again with --resume to carry on from there', err=True)
+    raise
+
+  for sink in sinks.values():
+    sink.close()
+  if checkpoints:
+    checkpoints.remove()
+  if sharded:
+    manifest_path = write_manifest(output_dir, sinks, shards or 1, max_rows_per_file)
+
+  for name, sink in sinks.items():
+    click.echo(f'Wrote {sink.row_count} rows, {format_bytes(sink.byte_count)} '
+               f'to {basename(paths[name])}', err=True)
+
+  if rejected_count:
+    click.echo(f'Rejected {rejected_count} rows, see {basename(paths["rejects"])}', err=True)
+
+  if sharded:
+    file_count = sum(len(sink.files) for sink in sinks.values())
+    click.echo(f'Listed {file_count} files in {basename(manifest_path)}', err=True)
+
+  if contact_index is not None:
+    contact_index.close()
+    click.echo(f'Skipped {contact_index.skipped_count} rows for contacts that '
+               f'aren\'t in {contact_index_path}', err=True)
+
+  if consolidation:
+    click.echo(f'Consolidated {consolidation.row_count} rows into '
+               f'{consolidation.contact_count} contacts', err=True)
+
+  if state:
+    state.commit()
+    state.close()
+    click.echo(f'Skipped {state.skipped_count} previously prepared rows', err=True)
+    if state.changed_count:
+      click.echo(f'Skipped {state.changed_count} previously prepared rows that have been '
+                 'edited since, which aren\'t prepared again', err=True)
+
+def generate_outputs(calls_file_path, workers=1, state=None, engine='rows',
+                     start=None, vocabularies=None, contact_index=None,
+                     consolidation=None, **users):
+  """Returns an iterator over (output name, part, values) for every output
+     row, from a single pass over the spreadsheet. With a ContactIndex, rows
+     for contacts that aren't in it are skipped as they're read, since the
+     import would drop them. With an ImportState, rows prepared by previous
+     runs are skipped, and rows that are rejected are left for the next
+     run. With a Consolidation, the remaining rows of each
+     contact are merged into one, in contact order, with blank
+     PROFILE_FIELDS filled from earlier rows. vocabularies, from
+     load_rules(), are used here and in the workers.
+
+  The outputs of each chunk of rows are followed by a (CHECKPOINT, 0,
+  Checkpoint) marker. Given one as start, the rows after it are generated."""
+
+  if engine == 'columnar':
+    # Before any rows are read, rather than in every chunk
+    from .columnar import require_numpy
+    require_numpy()
+
+  start = start or Checkpoint(source_row=0, offset=None)
+  fields, reader = read_spreadsheet(calls_file_path, offset=start.offset)
+  # Numbered as they're read, so source_row is the row of the spreadsheet
+  # whichever rows are skipped
+  rows = enumerate(profiling.timed_iter('read', reader), start.source_row + 1)
+  if contact_index is not None:
+    rows = profiling.timed_iter('select_known',
+                                contact_index.select_known(rows, NHS_NUMBER_INDEX))
+  if state:
+    rows = profiling.timed_iter('select_new', state.select_new(fields, rows))
+
+  if consolidation:
+    rows = profiling.timed_iter('consolidate',
+                                consolidation.consolidate(rows, attempt_key,
+                                                          PROFILE_FIELD_INDEXES))
+
+  # The reader has read up to the end of the chunk when it's yielded
+  chunks = ((chunk, Checkpoint(chunk[-1][0], reader.offset))
+            for chunk in chunked(rows))
+  vocabularies = vocabularies or load_rules()
+  use_rules(vocabularies)
+  process = partial(process_chunk, engine=engine, **users)
+  outputs = chain.from_iterable(profiling.timed_iter('prepare',
+                                                     ordered_map(process, chunks, workers,
+                                                                 initializer=use_rules,
+                                                                 initargs=(vocabularies,))))
+  return release_rejects(outputs, state, consolidation is not None) if state else outputs
+
+def release_rejects(outputs, state, consolidated=False):
+  """Passes outputs through, releasing rejected rows from state so they're
+     prepared again by the next run. A consolidated row releases all of its
+     contact's rows."""
+
+  for output in outputs:
+    if output[0] == 'rejects':
+      state.release(output[2][0], contact=consolidated)
+    yield output
+
+def read_spreadsheet(calls_file_path, offset=None):
+  """Returns the renamed spreadsheet header and a reader over its rows"""
 
-def compose_body(row, fields, prefix_lines=None):
-  lines = [f"{value['label']}: {row[key].strip()}"
-          for key, value in fields.items()
-          if value['label'] and row[key] and row[key].strip()]
+  # Expected file is in 'windows-1252' file encoding
+  return read_columns(calls_file_path, rename_map, encoding='windows-1252', offset=offset)
 
-  if prefix_lines:
-    lines = prefix_lines + lines
+def attempt_key(values):
+  """Orders the spreadsheet values of a contact's rows by attempt, for
+     Consolidation, or None for rows without a valid attempt date"""
 
-  return '\n'.join(lines)
+  try:
+    attempt_date = parse_date(values[LATEST_ATTEMPT_DATE_INDEX])
+  except ValueError:
+    return None
+  return (values[NHS_NUMBER_INDEX], attempt_date,
+          try_convert(parse_attempt_time, values[LATEST_ATTEMPT_TIME_INDEX]) or '')
 
-def compose_generic_need_desc(row, fields):
-  return compose_body(row, fields, prefix_lines=[MSG_GENERIC_NEED])
+def normalize_row(source_row, values):
+  """Returns a CallRecord for the spreadsheet values, in calls_header_map
+     order, or None for rows without an attempt date. Raises ValueError for
+     an attempt date that doesn't parse."""
 
-def compose_other_need_desc(row, fields):
-  return compose_body(row, fields, prefix_lines=[MSG_OTHER_NEED])
+  latest_attempt_date = values[LATEST_ATTEMPT_DATE_INDEX]
+  if not latest_attempt_date:
+    return None
 
-def compose_callback_need_desc(row, fields):
-  return compose_body(row, fields, prefix_lines=[MSG_CALLBACK_NEED])
+  import_data = serialize_row(values, keys=IMPORT_DATA_KEYS)
+  values = list(values)
+  # A date that doesn't parse rejects the row, rather than leaving every
+  # output it goes to without a created_at
+  values[LATEST_ATTEMPT_DATE_INDEX] = parse_date(latest_attempt_date)
+  return CallRecord(*values, import_data, source_row)
+
+def process_rows(rows, food_needs_user, complex_needs_user,
+                 simple_needs_user, call_log_review_user, engine='rows'):
+  """Derives the output rows for a chunk of (source_row, spreadsheet values)
+     pairs. Chunks are independent of each other, so they can be run in
+     worker processes."""
+
+  # Rows that fail at any step are rejected with the reason, and none of
+  # their other outputs are written
+  rejects = []
+  normalized_rows = []
+  for source_row, values in rows:
+    try:
+      row = normalize_row(source_row, values)
+    except Exception as error:
+      rejects.append(reject(source_row, values[NHS_NUMBER_INDEX],
+                            serialize_row(values, keys=IMPORT_DATA_KEYS), error))
+      continue
+    if row:
+      normalized_rows.append(row)
+
+  if engine == 'columnar':
+    from .columnar import classify_rows as classify
+  else:
+    classify = classify_rows
+
+  users = {'complex_needs_user': complex_needs_user,
+           'simple_needs_user': simple_needs_user,
+           'call_log_review_user': call_log_review_user}
+  try:
+    classifications = classify(normalized_rows, **users)
+  except click.ClickException:
+    raise
+  except Exception:
+    # Classify the rows one at a time, to find the ones that fail
+    classifications = [try_classify_row(row, **users) for row in normalized_rows]
+
+  outputs = []
+  for row, classification in zip(normalized_rows, classifications):
+    try:
+      if isinstance(classification, Exception):
+        raise classification
+      outputs.extend(process_row(row, classification,
+                                 food_needs_user=food_needs_user,
+                                 complex_needs_user=complex_needs_user,
+                                 simple_needs_user=simple_needs_user))
+    except Exception as error:
+      rejects.append(reject(row.source_row, row.nhs_number, row.import_data, error))
+
+  outputs.extend(sorted(rejects, key=lambda output: output[2][0]))
+  return outputs
+
+def process_chunk(chunk, **options):
+  """Like process_rows(), for a (rows, Checkpoint) pair. The outputs end with
+     the checkpoint, which is reached once they've all been written."""
+
+  rows, checkpoint = chunk
+  return [*process_rows(rows, **options), (CHECKPOINT, 0, checkpoint)]
+
+def reject(source_row, nhs_number, import_data, error):
+  return ('rejects', 0, (source_row, nhs_number, f'{type(error).__name__}: {error}', import_data))
+
+def try_classify_row(row, **users):
+  try:
+    return classify_row(row, **users)
+  except Exception as error:
+    return error
+
+def classify_rows(rows, **users):
+  return [classify_row(row, **users) for row in rows]
+
+def classify_row(row, complex_needs_user, simple_needs_user, call_log_review_user):
+  """Applies the classification rules to a row"""
+
+  food_priority = try_convert(parse_food_priority, row.food_priority)
+  callback_date = try_convert(parse_callback_date, row.callback_date)
+
+  return Classification(
+    triage_completed_on=determine_triage_completion(row),
+    needs_food=bool(needs_food(row)),
+    food_priority=food_priority,
+    food_completed_on=determine_food_completion(row, food_priority),
+    callback_date=callback_date,
+    needs_callback=bool(needs_callback(row, callback_date)),
+    needs_prescriptions=bool(row.addl_medication_prescriptions),
+    needs_mental_wellbeing=bool(row.addl_mental_wellbeing),
+    needs_financial=bool(row.addl_financial),
+    needs_other_support=bool(needs_other_support(row)),
+    other_need_user=determine_other_need_user(row,
+                                              complex_needs_user=complex_needs_user,
+                                              simple_needs_user=simple_needs_user,
+                                              call_log_review_user=call_log_review_user))
+
+def process_row(row, classification, food_needs_user, complex_needs_user,
+                simple_needs_user):
+  """Derives the rows each output gets from a single classified call log row,
+     as a list of (output name, part, values) tuples"""
+
+  # Needs and notes only hold the fields they add, and the rest of their
+  # values come from the record
+  outputs = []
+  def emit(name, values, part=0, record=row):
+    header, _ = OUTPUTS[name]
+    outputs.append((name, part, tuple(values[field] if field in values
+                                      else getattr(record, field, None)
+                                      for field in header)))
+
+  # Labelled lines are composed once and shared by every description
+  lines = composer.lines(row)
+  body = compose_body(lines)
+
+  original_triage_need = {'category': 'phone triage',
+                          'name': MSG_ORIGINAL_TRIAGE_NEED,
+                          'completed_on': classification.triage_completed_on}
+  emit('original_triage_needs', original_triage_need)
+
+  emit('original_triage_notes', {'category': 'phone_import', 'body': body})
+
+  call_notes = []
+  if row.was_contact_made is not None:
+    call_notes = list(generate_call_notes(row))
+    for nhs_number, created_at, updated_at, category in call_notes:
+      emit('original_triage_notes', {'nhs_number': nhs_number,
+                                     'category': category,
+                                     'body': MSG_CALL_LOG_NOTE,
+                                     'created_at': created_at,
+                                     'updated_at': updated_at,
+                                     'source_row': row.source_row}, part=1, record=None)
+
+  food_need = None
+  if classification.needs_food:
+    food_need = {'category': 'groceries and cooked meals',
+                 'food_priority': classification.food_priority,
+                 'completed_on': classification.food_completed_on,
+                 'user_id': food_needs_user}
+    food_need['supplemental_data'] = construct_supplemental_data(food_need)
+    food_need['name'] = compose_food_need_desc(
+      composer.replace(lines, food_priority=food_need['food_priority']), food_need)
+    # Kept structured for the QA summary, and only serialized for the output
+    emit('food_needs', {**food_need,
+                        'supplemental_data': json.dumps(food_need['supplemental_data'])})
+
+  callback_need = None
+  if classification.needs_callback:
+    callback_need = {'category': 'phone triage'}
+    callback_need['name'] = compose_callback_need_desc(
+      composer.replace(lines, callback_date=classification.callback_date))
+    callback_need['start_on'] = determine_callback_start_date(row, classification.callback_date)
+    emit('callback_needs', callback_need)
+
+  other_need_desc = compose_other_need_desc(lines)
+  remaining_need_rules = [
+    (classification.needs_prescriptions, 'prescription pickups', simple_needs_user),
+    (classification.needs_mental_wellbeing, 'physical and mental wellbeing', complex_needs_user),
+    (classification.needs_financial, 'financial support', complex_needs_user),
+    (classification.needs_other_support, 'other', classification.other_need_user),
+  ]
+  remaining_needs = [(part, {'category': category,
+                             'name': other_need_desc,
+                             'user_id': user_id})
+                     for part, (selected, category, user_id) in enumerate(remaining_need_rules)
+                     if selected]
+  for part, remaining_need in remaining_needs:
+    emit('remaining_needs', remaining_need, part=part)
 
-def compose_food_need_desc(row, fields):
+  # TODO: prefix with [Import]
+  emit('contact_profile_updates', {
+    'nhs_number': row.nhs_number,
+    'additional_info': compose_additional_info(lines),
+    'delivery_details': compose_delivery_details(lines),
+    'dietary_details': compose_dietary_details(row),
+    'has_covid_symptoms': try_convert(parse_covid_symptoms, row.has_covid_symptoms),
+    'source_row': row.source_row
+  })
+
+  # Summarises what this row generated, so no nhs_number index is needed
+  emit('quality_assurance', {
+    'nhs_number': row.nhs_number,
+    'latest_attempt_date': row.latest_attempt_date,
+    'original_triage_status': qa_original_triage_status(original_triage_need),
+    'original_triage_call_notes': qa_original_triage_call_notes(call_notes),
+    'food_need': qa_food_need(food_need),
+    'callback_need': qa_callback_need(callback_need),
+    'remaining_needs': qa_remaining_needs([need for _, need in remaining_needs]),
+    'call_log': body
+  })
+
+  return outputs
+
+def compose_body(lines, prefix_lines=None):
+  return compose(lines, prefix_lines=prefix_lines)
+
+def compose_generic_need_desc(lines):
+  return compose(lines, prefix_lines=[MSG_GENERIC_NEED])
+
+def compose_other_need_desc(lines):
+  return compose(lines, prefix_lines=[MSG_OTHER_NEED])
+
+def compose_callback_need_desc(lines):
+  return compose(lines, prefix_lines=[MSG_CALLBACK_NEED])
+
+def compose_food_need_desc(lines, need):
   prefix_lines = [MSG_GENERIC_NEED]
 
-  if row['completed_on']:
+  if need['completed_on']:
     prefix_lines.append(MSG_CLOSED_FOOD_NEED)
 
-  return compose_body(row, fields, prefix_lines=prefix_lines)
+  return compose(lines, prefix_lines=prefix_lines)
 
-def compose_additional_info(row, fields):
+def compose_additional_info(lines):
   relevant_fields = ['household_count', 'support_already_geting', 'notes']
-  return compose_body(row, pluck(fields, relevant_fields))
+  return compose(lines, keys=relevant_fields)
 
-def compose_delivery_details(row, fields):
+def compose_delivery_details(lines):
   relevant_fields = ['delivery_contact', 'delivery_special_info']
-  return compose_body(row, pluck(fields, relevant_fields))
+  return compose(lines, keys=relevant_fields)
 
 def compose_dietary_details(row):
-  if not row['dietary_requirements'].lower().strip() == 'no':
-    return row['dietary_requirements']
-
-def pluck(dict, keys):
-  return { key: value for key, value in dict.items() if key in keys }
+  if not row.dietary_requirements.lower().strip() == 'no':
+    return row.dietary_requirements
 
 def determine_triage_completion(row):
-  completed_values = ['yes', 'no 3 attempts made']
-  return row['latest_attempt_date'] if row['was_contact_made'].lower() in completed_values else None
+  return (row.latest_attempt_date
+          if rules.contact(row.was_contact_made) in TRIAGE_COMPLETING_CONTACTS
+          else None)
 
 def parse_covid_symptoms(value):
   clean_value = value.strip().lower()
@@ -246,98 +632,89 @@ def parse_covid_symptoms(value):
     return None
 
 def generate_call_notes(row):
-  was_contact_made = row['was_contact_made'].lower()
-  failure_category = ('phone_message'
-    if row['outcome'] == 'Left voicemail'
-    else 'phone_failure')
-
-  if was_contact_made == 'yes':
+  count, successful = CONTACT_CALLS[rules.contact(row.was_contact_made)]
+  if successful:
     category = 'phone_success'
-    count = 1
-  elif (was_contact_made == 'no -1 attempt made'
-    or was_contact_made == 'invalid phone numbers'):
-    category = failure_category
-    count = 1
-  elif was_contact_made == 'no 2 attempts made':
-    category = failure_category
-    count = 2
-  elif was_contact_made == 'no 3 attempts made':
-    category = failure_category
-    count = 3
+  elif rules.outcome(row.outcome) == Outcome.LEFT_VOICEMAIL:
+    category = 'phone_message'
+  else:
+    category = 'phone_failure'
 
   for x in range(count):
     yield [
-      row['nhs_number'],
-      row['created_at'],
-      row['updated_at'],
+      row.nhs_number,
+      row.created_at,
+      row.updated_at,
       category
     ]
 
+# '9.05' => '09:05', so times sort in order
+def parse_attempt_time(value):
+  hours, minutes = re.match(r'\s*(\d{1,2})[:.](\d{2})', value).groups()
+  return f'{int(hours):02}:{minutes}'
+
 def parse_food_priority(value):
   return re.search(r'priority (\d)', value, re.IGNORECASE) \
            .group(1)
 
-def determine_food_completion(row):
-  return row['latest_attempt_date'] if row['food_priority'] in ['1', '2'] else None
+def determine_food_completion(row, food_priority):
+  return row.latest_attempt_date if food_priority in COMPLETED_FOOD_PRIORITIES else None
 
-def construct_supplemental_data(row):
+def construct_supplemental_data(need):
   supplemental_data = {
     'food_service_type': 'Grocery delivery'
   }
-  if row['food_priority']:
-    supplemental_data['food_priority'] = row['food_priority']
+  if need['food_priority']:
+    supplemental_data['food_priority'] = need['food_priority']
 
-  return json.dumps(supplemental_data)
+  return supplemental_data
 
+# Values without a date, like 'next week', return None rather than raising,
+# so they're cached too
+@lru_cache(maxsize=DATE_CACHE_SIZE)
 def parse_callback_date(value):
-  date_like_string = re.search(r'(\d+[/\.]\d+[/\.]\d+)', value).group(1)
-  if date_like_string:
+  match = re.search(r'(\d+[/\.]\d+[/\.]\d+)', value)
+  if match:
     possible_formats = [
       '%d/%m/%Y',
       '%d.%m.%y'
     ]
     for fmt in possible_formats:
       try:
-        return datetime.strptime(date_like_string, fmt) \
-                       .date().isoformat()
+        return parse_date_as(match.group(1), fmt)
       except ValueError:
         pass
 
   return None
 
 def needs_food(row):
-  # source data uses trailing space
-  return (row['outcome'] in ['Food referral ', 'Food and Other referral']
-          or row['food_priority'])
+  return (rules.outcome(row.outcome) in FOOD_OUTCOMES
+          or row.food_priority)
 
-def needs_callback(row):
-  return (row['callback_date']
+def needs_callback(row, callback_date):
+  return (callback_date
           or needs_food(row)
-          or row['book_weekly_food_delivery'] == True
-          or row['outcome'] == 'Call back ') # source data uses trailing space
+          or row.book_weekly_food_delivery == True
+          or rules.outcome(row.outcome) == Outcome.CALL_BACK)
 
 def needs_other_support(row):
-  return (row['outcome'] in ['Other referral', 'Food and Other referral']
+  return (rules.outcome(row.outcome) in OTHER_OUTCOMES
           or has_complex_other_need(row)
           or has_simple_other_need(row)
           or has_value_in_misc_fields(row))
 
 def has_complex_other_need(row):
-  return (row['addl_adult_social_care']
-          or row['addl_children_services']
-          or row['addl_safeguarding'])
+  return any(getattr(row, field) for field in COMPLEX_NEED_FIELDS)
 
 def has_simple_other_need(row):
-  return (row['addl_housing_waste']
-          or row['addl_medical_appt_transport']
-          or row['addl_referrals'])
+  return any(getattr(row, field) for field in SIMPLE_NEED_FIELDS)
 
 def has_value_in_misc_fields(row):
-  return row['addl_misc_other1'] or row['addl_misc_other2']
+  return any(getattr(row, field) for field in MISC_NEED_FIELDS)
 
-def determine_callback_start_date(row):
-  return (row['callback_date']
-          or date.fromisoformat(row['latest_attempt_date']) + timedelta(days=6))
+def determine_callback_start_date(row, callback_date):
+  return (callback_date
+          or date.fromisoformat(row.latest_attempt_date) + timedelta(days=6))
 
 def determine_other_need_user(row, simple_needs_user, complex_needs_user, call_log_review_user):
   if has_complex_other_need(row):
@@ -347,23 +724,20 @@ def determine_other_need_user(row, simple_needs_user, complex_needs_user, call_l
   else:
     return call_log_review_user
 
-def qa_original_triage_status(lookup, row):
-  match = lookup.get(row['nhs_number'])
-  return 'Completed' if match['completed_on'] else 'To do'
+def qa_original_triage_status(need):
+  return 'Completed' if need['completed_on'] else 'To do'
 
-def qa_original_triage_call_notes(lookup, row):
-  matches = lookup.get(row['nhs_number']) # returns list
-  if matches:
-    categories = [ note['category'] for note in matches ]
+def qa_original_triage_call_notes(notes):
+  if notes:
+    categories = [ category for _, _, _, category in notes ]
     return ', '.join(categories)
 
-def qa_food_need(lookup, row):
-  match = lookup.get(row['nhs_number'])
-  if match:
-    status = 'Completed' if match['completed_on'] else 'To do'
-    assigned_to = match['user_id']
-    priority = (json.loads(match['supplemental_data']).get('food_priority', '')
-                if match['supplemental_data']
+def qa_food_need(need):
+  if need:
+    status = 'Completed' if need['completed_on'] else 'To do'
+    assigned_to = need['user_id']
+    priority = (need['supplemental_data'].get('food_priority', '')
+                if need['supplemental_data']
                 else None)
 
     lines = ['Food need created',
@@ -373,19 +747,17 @@ def qa_food_need(lookup, row):
 
     return '\n'.join(lines)
 
-def qa_callback_need(lookup, row):
-  match = lookup.get(row['nhs_number'])
-  if match:
-    start_on = match['start_on']
+def qa_callback_need(need):
+  if need:
+    start_on = need['start_on']
 
     lines = ['Callback need created',
              f'Start on: {start_on}']
 
     return '\n'.join(lines)
 
-def qa_remaining_needs(lookup, row):
-  matches = lookup.get(row['nhs_number']) # returns list
-  if matches:
+def qa_remaining_needs(needs):
+  if needs:
     lines = [f"{need['category'].title()} (Assigned to {need['user_id']})"
-            for need in matches]
+            for need in needs]
     return '\n'.join(lines)
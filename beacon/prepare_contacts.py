@@ -1,47 +1,113 @@
+import json
 from datetime import datetime
+from functools import partial
+from itertools import chain
+from os.path import basename
 
 import click
-import petl as etl
 
-from .helpers import serialize_row, parse_date
+from .helpers import serialize_row, parse_date, try_convert
+from . import profiling
+from .reader import INPUT_PATH, InputSource
+from .sinks import format_option, compression_option, open_sink
+from .parallel import chunked, ordered_map, workers_option
+
+CONTACT_FIELDS = ['nhs_number',
+                  'first_name',
+                  'middle_names',
+                  'surname',
+                  'address',
+                  'postcode',
+                  'telephone',
+                  'mobile',
+                  'date_of_birth',
+                  'created_at',
+                  'updated_at',
+                  'gds_import_data']
+
+# Column types for the binary output formats. Other columns are text.
+CONTACT_TYPES = {
+  'date_of_birth': 'date',
+  'created_at': 'timestamp',
+  'updated_at': 'timestamp'
+}
+
+ADDRESS_FIELDS = ['Address1', 'Address2', 'Address3', 'Address4', 'Address5']
+
+rename_map = {'NHSNumber': 'nhs_number',
+              'FirstName': 'first_name',
+              'MiddleName': 'middle_names',
+              'LastName': 'surname',
+              'Postcode': 'postcode',
+              'DOB': 'date_of_birth',
+              'Phone': 'telephone',
+              'Mobile': 'mobile'}
 
 @click.command()
-@click.argument('gds_file_path')
-def prepare_contacts(gds_file_path):
+@click.argument('gds_file_path', type=INPUT_PATH)
+@click.option('-o', '--output', 'output_path', default='-',
+              type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help='File to write the contacts to, instead of stdout')
+@workers_option
+@format_option
+@compression_option
+def prepare_contacts(gds_file_path, output_path, workers, output_format, compression):
   """Extracts core contact fields from gds_file_path, and adds a serialized
-     version of the records from as a json column."""
+     version of the records from as a json column. gds_file_path can be - for
+     stdin, and compressed."""
+
+  # Rows are written in order as soon as their chunk is ready
+  contacts = generate_contacts(gds_file_path, workers)
+  sink = open_sink(output_path, CONTACT_FIELDS, output_format=output_format, types=CONTACT_TYPES,
+                   compression=compression)
+  name = 'stdout' if output_path == '-' else basename(output_path)
+  sink = profiling.timed_sink(name, sink, CONTACT_FIELDS)
+  try:
+    for contact in contacts:
+      sink.write(contact)
+  finally:
+    sink.close()
+
+def generate_contacts(gds_file_path, workers=1):
+  """Returns an iterator over the prepared contact rows, in input order"""
+
+  # petl is slow to import, and only needed here
+  import petl as etl
 
   now = datetime.now().isoformat()
-  gds_table = etl.fromcsv(gds_file_path)
-  gds_header = gds_table.fieldnames()
-
-  gds_table \
-    .addfield('gds_import_data', partial(serialize_row, keys=gds_header)) \
-    .addfield('created_at', now) \
-    .addfield('updated_at', now) \
-    .addfield('address', concat_address) \
-    .rename({'NHSNumber': 'nhs_number',
-             'FirstName': 'first_name',
-             'MiddleName': 'middle_names',
-             'LastName': 'surname',
-             'Postcode': 'postcode',
-             'DOB': 'date_of_birth',
-             'Phone': 'telephone',
-             'Mobile': 'mobile'}) \
-    .convert('date_of_birth', parse_date) \
-    .cut('nhs_number',
-         'first_name',
-         'middle_names',
-         'surname',
-         'address',
-         'postcode',
-         'telephone',
-         'mobile',
-         'date_of_birth',
-         'created_at',
-         'updated_at',
-         'gds_import_data') \
-    .tocsv()
+  gds_table = iter(etl.fromcsv(InputSource(gds_file_path)))
+  gds_header = next(gds_table)
+  gds_table = profiling.timed_iter('read', gds_table)
+
+  missing_fields = [field for field in [*rename_map, *ADDRESS_FIELDS]
+                    if field not in gds_header]
+  if missing_fields:
+    raise click.ClickException(f"Missing GDS columns: {', '.join(missing_fields)}")
+
+  process = partial(process_rows, gds_header, now=now)
+  chunks = ordered_map(process, chunked(gds_table), workers)
+  return chain.from_iterable(profiling.timed_iter('prepare', chunks))
+
+def process_rows(gds_header, rows, now):
+  return [prepare_contact(gds_header, values, now) for values in rows]
+
+def prepare_contact(gds_header, values, now):
+  if len(values) < len(gds_header):
+    # Short rows are padded with None, as petl did, which the fast
+    # serializer doesn't encode
+    values = (*values, *[None] * (len(gds_header) - len(values)))
+    import_data = json.dumps(dict(zip(gds_header, values)))
+  else:
+    import_data = serialize_row(values, keys=gds_header)
+
+  row = dict(zip(gds_header, values))
+  contact = { rename_map.get(key, key): value for key, value in row.items() }
+  contact['gds_import_data'] = import_data
+  contact['created_at'] = now
+  contact['updated_at'] = now
+  contact['address'] = concat_address(row)
+  contact['date_of_birth'] = try_convert(parse_date, contact['date_of_birth'])
+  return [contact.get(field) for field in CONTACT_FIELDS]
 
 # Concatenate non-empty address parts with ', ' separator
 def concat_address(row):
@@ -0,0 +1,202 @@
+import importlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from functools import wraps
+
+try:
+  import resource
+except ImportError: # not available on Windows
+  resource = None
+
+# Functions timed as stages when profiling, as (module, attribute). Times are
+# inclusive, so normalize_row includes serialize_row and parse_date.
+INSTRUMENTED = [
+  ('beacon.prepare_calls', 'normalize_row'),
+  ('beacon.prepare_calls', 'serialize_row'),
+  ('beacon.prepare_calls', 'parse_date'),
+  ('beacon.prepare_calls', 'process_row'),
+  ('beacon.prepare_calls', 'parse_food_priority'),
+  ('beacon.prepare_calls', 'parse_callback_date'),
+  ('beacon.prepare_calls', 'compose'),
+  ('beacon.prepare_contacts', 'prepare_contact'),
+  ('beacon.prepare_contacts', 'serialize_row'),
+  ('beacon.prepare_contacts', 'parse_date'),
+]
+
+# How often a stage samples the process's peak memory
+MEMORY_SAMPLE_INTERVAL = 1000
+
+_profiler = None
+
+def start(command):
+  """Turns on profiling for the rest of the process"""
+
+  global _profiler
+  _profiler = Profiler(command)
+  # Commands are imported lazily, so they may not have been yet
+  for module_name, attribute in INSTRUMENTED:
+    module = importlib.import_module(module_name)
+    if hasattr(module, attribute):
+      setattr(module, attribute, _profiler.timed(attribute, getattr(module, attribute)))
+  return _profiler
+
+def current():
+  return _profiler
+
+def timed_iter(name, iterable):
+  """Times pulling items from iterable as a stage, if profiling"""
+
+  return _profiler.timed_iter(name, iterable) if _profiler else iterable
+
+def timed_sink(name, sink, header):
+  """Times and counts the rows written to sink, if profiling"""
+
+  return ProfiledSink(_profiler, name, sink, header) if _profiler else sink
+
+def peak_memory_kb():
+  if not resource:
+    return None
+
+  # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+  scale = 1024 if sys.platform == 'darwin' else 1
+  return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) // scale
+
+class Stage:
+  """Totals for one stage. rows_in counts calls, or items pulled for
+     iterator stages (chunks, for 'prepare'), and rows_out counts the rows
+     they returned."""
+
+  def __init__(self):
+    self.rows_in = 0
+    self.rows_out = 0
+    self.wall_time = 0.0
+    self.cpu_time = 0.0
+    self.peak_memory_kb = None
+
+  def record(self, rows_out, wall_time, cpu_time):
+    self.rows_in += 1
+    self.rows_out += rows_out
+    self.wall_time += wall_time
+    self.cpu_time += cpu_time
+    if self.rows_in % MEMORY_SAMPLE_INTERVAL == 1:
+      self.peak_memory_kb = peak_memory_kb()
+
+  def report(self):
+    return {'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'wall_time': round(self.wall_time, 6),
+            'cpu_time': round(self.cpu_time, 6),
+            'peak_memory_kb': self.peak_memory_kb}
+
+class Profiler:
+  """Collects row counts, wall and CPU time and peak memory for each stage of
+     a command, and for each output it writes.
+
+  Stages run in worker processes are only broken down when --workers is 1;
+  otherwise they are covered by the 'prepare' stage, the time spent waiting
+  on the workers."""
+
+  def __init__(self, command):
+    self.command = command
+    self.report_dir = '.'
+    self.started = (time.perf_counter(), time.process_time())
+    self.stages = {}
+    self.outputs = {}
+
+  def stage(self, name):
+    return self.stages.setdefault(name, Stage())
+
+  def timed(self, name, func):
+    stage = self.stage(name)
+
+    @wraps(func)
+    def timed_func(*args, **kwargs):
+      wall, cpu = time.perf_counter(), time.process_time()
+      result = None
+      try:
+        result = func(*args, **kwargs)
+        return result
+      finally:
+        stage.record(count_rows(result),
+                     time.perf_counter() - wall,
+                     time.process_time() - cpu)
+    return timed_func
+
+  def timed_iter(self, name, iterable):
+    stage = self.stage(name)
+    iterator = iter(iterable)
+    while True:
+      wall, cpu = time.perf_counter(), time.process_time()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      stage.record(count_rows(item),
+                   time.perf_counter() - wall,
+                   time.process_time() - cpu)
+      yield item
+
+  def report(self):
+    wall, cpu = self.started
+    return {
+      'command': self.command,
+      'wall_time': round(time.perf_counter() - wall, 6),
+      'cpu_time': round(time.process_time() - cpu, 6),
+      'peak_memory_kb': peak_memory_kb(),
+      'stages': { name: stage.report()
+                  for name, stage in self.stages.items()
+                  if stage.rows_in },
+      'outputs': { name: output.report()
+                   for name, output in self.outputs.items() }
+    }
+
+  def write_report(self):
+    path = os.path.join(self.report_dir, 'profile.json')
+    with open(path, 'w') as f:
+      json.dump(self.report(), f, indent=2)
+    return path
+
+class ProfiledSink:
+  """Wraps a sink, timing its writes and counting rows per category"""
+
+  def __init__(self, profiler, name, sink, header):
+    self.sink = sink
+    self.stage = Stage()
+    self.category_index = header.index('category') if 'category' in header else None
+    self.categories = Counter()
+    profiler.outputs[name] = self
+
+  def __getattr__(self, name):
+    return getattr(self.sink, name)
+
+  def write(self, values, *args):
+    wall, cpu = time.perf_counter(), time.process_time()
+    self.sink.write(values, *args)
+    self.stage.record(1, time.perf_counter() - wall, time.process_time() - cpu)
+    if self.category_index is not None:
+      self.categories[values[self.category_index]] += 1
+
+  def close(self):
+    wall, cpu = time.perf_counter(), time.process_time()
+    self.sink.close()
+    self.stage.wall_time += time.perf_counter() - wall
+    self.stage.cpu_time += time.process_time() - cpu
+
+  def report(self):
+    report = self.stage.report()
+    del report['rows_in']
+    report['rows'] = report.pop('rows_out')
+    if getattr(self.sink, 'byte_count', None) is not None:
+      report['bytes'] = self.sink.byte_count
+    if self.categories:
+      report['categories'] = dict(self.categories)
+    return report
+
+def count_rows(result):
+  if isinstance(result, (list, tuple)) and result and isinstance(result[0], (list, tuple)):
+    return len(result)
+  return 0 if result is None else 1
@@ -0,0 +1,221 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import sys
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from operator import itemgetter
+
+import click
+
+# Read the input a megabyte at a time, rather than the default 8KB
+BUFFER_SIZE = 1 << 20
+
+# An input file argument, read by open_input(), so it can be - for stdin
+INPUT_PATH = click.Path(exists=True, dir_okay=False, allow_dash=True)
+
+# Leading bytes of the compressed formats that are read transparently
+MAGIC_NUMBERS = {
+  b'\x1f\x8b': 'gzip',
+  b'BZh': 'bz2',
+  b'\xfd7zXZ\x00': 'xz',
+  b'\x28\xb5\x2f\xfd': 'zstd',
+  b'PK\x03\x04': 'zip'
+}
+
+def open_input(path):
+  """Opens path for reading in binary, or stdin for '-'. gzip, bz2, xz,
+     zstd and zip files are decompressed as they're read, whatever they're
+     called. A zip file has to hold a single file, and can't be read from
+     a pipe."""
+
+  if path == '-':
+    file = open(sys.stdin.fileno(), 'rb', buffering=BUFFER_SIZE, closefd=False)
+  else:
+    file = open(path, 'rb', buffering=BUFFER_SIZE)
+
+  head = file.peek(8)
+  compression = next((compression for magic, compression in MAGIC_NUMBERS.items()
+                      if head.startswith(magic)), None)
+  if not compression:
+    return file
+
+  # The decompressors open named files themselves, and close them
+  if path != '-':
+    file.close()
+    file = path
+
+  if compression == 'gzip':
+    return gzip.open(file)
+  if compression == 'bz2':
+    return bz2.open(file)
+  if compression == 'xz':
+    return lzma.open(file)
+  if compression == 'zstd':
+    return open_zstd(file)
+  return open_zip_member(file, path)
+
+def open_zstd(file):
+  try:
+    import zstandard
+  except ImportError:
+    raise click.ClickException('Reading zstd files requires zstandard, '
+                               'install with: pip3 install "beacon-data-importer[zstd]"')
+
+  if isinstance(file, str):
+    file = open(file, 'rb', buffering=BUFFER_SIZE)
+  reader = zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+  return io.BufferedReader(reader, BUFFER_SIZE)
+
+def open_zip_member(file, path):
+  # The contents of a zip file are listed at its end
+  if not isinstance(file, str) and not file.seekable():
+    raise click.ClickException('zip files can\'t be read from a pipe, '
+                               'pass the file or unzip it into the pipe')
+
+  with zipfile.ZipFile(file) as archive:
+    members = [member for member in archive.infolist() if not member.is_dir()]
+    if len(members) != 1:
+      raise click.ClickException(f'{path} should hold a single file, not '
+                                 f'{", ".join(member.filename for member in members) or "none"}')
+    # The member keeps the archive's file open until it's closed
+    return archive.open(members[0])
+
+class InputSource:
+  """A petl source reading path with open_input()"""
+
+  def __init__(self, path):
+    self.path = path
+
+  @contextmanager
+  def open(self, mode='rb'):
+    file = open_input(self.path)
+    try:
+      yield file
+    finally:
+      file.close()
+
+def read_columns(path, rename_map, encoding, offset=None):
+  """Returns the short names of the columns in rename_map, and a ColumnReader
+     over tuples of each row's values for those columns, in the same order.
+
+  The header is checked before any rows are read: missing columns are an
+  error, and columns that aren't in rename_map are reported and ignored.
+  Short rows are padded with empty values. Given the offset of a row, from
+  ColumnReader.offset, reading carries on from that row."""
+
+  reader = ColumnReader(path, encoding)
+  try:
+    header = reader.read_header()
+    indexes = resolve_header(header, rename_map)
+    if offset:
+      reader.seek(offset)
+  except Exception:
+    reader.close()
+    raise
+
+  return list(rename_map.values()), reader.picking(indexes, len(header))
+
+def resolve_header(header, rename_map):
+  """Returns the index of each column of rename_map in header"""
+
+  missing = [original for original in rename_map if original not in header]
+  if missing:
+    raise click.ClickException('Missing columns:\n' +
+                               '\n'.join(f'  {rename_map[original]}: {original!r}'
+                                         for original in missing))
+
+  unknown = [original for original in header if original not in rename_map]
+  if unknown:
+    click.echo('Ignoring unknown columns:\n' +
+               '\n'.join(f'  {original!r}' for original in unknown), err=True)
+
+  return [header.index(original) for original in rename_map]
+
+class ColumnReader:
+  """Iterates over the picked values of each row. offset is where the row
+     after the last one returned starts in the file.
+
+  The file is read in binary and decoded a line at a time, so the offset is
+  known exactly: csv.reader only reads the lines of the row it's returning,
+  never ahead. For a compressed file, it's the offset in the decompressed
+  data. Lines can end in \n, \r\n or a lone \r, as in Excel's "CSV
+  (Macintosh)"."""
+
+  def __init__(self, path, encoding):
+    self.path = path
+    self.file = open_input(path)
+    self.encoding = encoding
+    self.offset = 0
+    # Lines read from the file but not yet returned, and the start of the
+    # next one, which carries on in the next block
+    self.lines = deque()
+    self.partial = b''
+    self.reader = csv.reader(self.read_lines())
+    self.rows = None
+
+  def read_header(self):
+    header = next(self.reader, None)
+    if header is None:
+      raise click.ClickException(f'{self.path} is empty')
+    return header
+
+  def seek(self, offset):
+    unread = b''.join(self.lines) + self.partial
+    self.lines.clear()
+    self.partial = b''
+    if self.file.seekable():
+      self.file.seek(offset)
+    elif offset - self.offset <= len(unread):
+      self.partial = unread[offset - self.offset:]
+    else:
+      # zstd streams can only be read forward
+      remaining = offset - self.offset - len(unread)
+      while remaining > 0:
+        skipped = len(self.file.read(min(remaining, BUFFER_SIZE)))
+        if not skipped:
+          break
+        remaining -= skipped
+    self.offset = offset
+
+  def picking(self, indexes, width):
+    self.rows = self.read_rows(itemgetter(*indexes), width)
+    return self
+
+  def close(self):
+    self.file.close()
+
+  def __iter__(self):
+    return self.rows
+
+  def __next__(self):
+    return next(self.rows)
+
+  def read_lines(self):
+    while True:
+      while self.lines:
+        line = self.lines.popleft()
+        self.offset += len(line)
+        yield line.decode(self.encoding)
+
+      block = self.file.read(BUFFER_SIZE)
+      if not block and not self.partial:
+        return
+      # Iterating a binary file only splits lines on \n, splitlines() on
+      # all three endings
+      self.lines.extend((self.partial + block).splitlines(keepends=True))
+      # Until the end of the file, the last line may carry on in the next
+      # block, and a \r at its end may be the start of a \r\n
+      self.partial = (self.lines.pop()
+                      if block and not self.lines[-1].endswith(b'\n')
+                      else b'')
+
+  def read_rows(self, pick, width):
+    with self.file:
+      for values in self.reader:
+        if len(values) < width:
+          values += [''] * (width - len(values))
+        yield pick(values)
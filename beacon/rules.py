@@ -0,0 +1,131 @@
+import json
+from enum import Enum
+
+import click
+
+class Contact(Enum):
+  """What a call log's was_contact_made value says about the calls made"""
+
+  BLANK = 'blank'
+  MADE = 'made'
+  FAILED_ONCE = 'failed_once'
+  FAILED_TWICE = 'failed_twice'
+  FAILED_THREE_TIMES = 'failed_three_times'
+
+class Outcome(Enum):
+  """A call log's outcome value"""
+
+  BLANK = 'blank'
+  FOOD_REFERRAL = 'food_referral'
+  FOOD_AND_OTHER_REFERRAL = 'food_and_other_referral'
+  OTHER_REFERRAL = 'other_referral'
+  CALL_BACK = 'call_back'
+  LEFT_VOICEMAIL = 'left_voicemail'
+  NO_SUPPORT_NEEDED = 'no_support_needed'
+
+# Contacts that close the original triage need
+TRIAGE_COMPLETING_CONTACTS = {Contact.MADE, Contact.FAILED_THREE_TIMES}
+
+# Call notes imported for each contact: how many, and whether they succeeded
+CONTACT_CALLS = {
+  Contact.BLANK: (0, False),
+  Contact.MADE: (1, True),
+  Contact.FAILED_ONCE: (1, False),
+  Contact.FAILED_TWICE: (2, False),
+  Contact.FAILED_THREE_TIMES: (3, False)
+}
+
+FOOD_OUTCOMES = {Outcome.FOOD_REFERRAL, Outcome.FOOD_AND_OTHER_REFERRAL}
+OTHER_OUTCOMES = {Outcome.OTHER_REFERRAL, Outcome.FOOD_AND_OTHER_REFERRAL}
+
+# Spreadsheet column => {value: enum value}. Values are matched ignoring
+# case and surrounding or repeated spaces, so 'Food referral ' and
+# 'food referral' are the same.
+DEFAULT_VOCABULARIES = {
+  'was_contact_made': {
+    '': 'blank',
+    'Yes': 'made',
+    'No -1 attempt made': 'failed_once',
+    'Invalid phone numbers': 'failed_once',
+    'No 2 attempts made': 'failed_twice',
+    'No 3 attempts made': 'failed_three_times'
+  },
+  'outcome': {
+    '': 'blank',
+    'Food referral': 'food_referral',
+    'Food and Other referral': 'food_and_other_referral',
+    'Other referral': 'other_referral',
+    'Call back': 'call_back',
+    'Left voicemail': 'left_voicemail',
+    'No support needed': 'no_support_needed'
+  }
+}
+
+ENUMS = {'was_contact_made': Contact, 'outcome': Outcome}
+
+# Distinct values remembered per column. Anything past this is still
+# classified, just not cached.
+CACHE_SIZE = 10000
+
+rules_option = click.option('--rules', 'rules_path', type=click.Path(exists=True, dir_okay=False),
+                            help='JSON file of more spreadsheet values to recognise, eg. '
+                                 '{"outcome": {"Food parcel": "food_referral"}}')
+
+def normalize(value):
+  return ' '.join(value.split()).casefold()
+
+class Vocabulary:
+  """Maps the values of a low cardinality column to enum members, through an
+     interning cache so each distinct value is only normalized once.
+
+  Unrecognised values are treated as blank, and reported once each."""
+
+  def __init__(self, column, enum, values):
+    self.column = column
+    self.enum = enum
+    self.members = { normalize(value): enum(name) for value, name in values.items() }
+    self.cache = {}
+
+  def __call__(self, value):
+    try:
+      return self.cache[value]
+    except KeyError:
+      pass
+
+    member = self.members.get(normalize(value))
+    if member is None:
+      click.echo(f'Unrecognised {self.column} value {value!r} is treated as blank, '
+                 'add it to a --rules file to classify it', err=True)
+      member = self.enum.BLANK
+    if len(self.cache) < CACHE_SIZE:
+      self.cache[value] = member
+    return member
+
+def load_rules(path=None):
+  """Returns the default vocabularies, extended by those in the JSON file at
+     path. It's checked here, so workers can be handed it as it is."""
+
+  vocabularies = { column: dict(values) for column, values in DEFAULT_VOCABULARIES.items() }
+  if path:
+    with open(path) as f:
+      extra = json.load(f)
+    for column, values in extra.items():
+      if column not in ENUMS:
+        raise click.ClickException(f'{path}: rules can only be given for '
+                                   f'{", ".join(ENUMS)}, not {column}')
+      allowed = [member.value for member in ENUMS[column]]
+      for value, name in values.items():
+        if name not in allowed:
+          raise click.ClickException(f'{path}: {column} value {value!r} should be one of '
+                                     f'{", ".join(allowed)}, not {name!r}')
+      vocabularies[column].update(values)
+  return vocabularies
+
+def use_rules(vocabularies):
+  """Sets the vocabularies contact() and outcome() use in this process"""
+
+  global contact, outcome
+  contact = Vocabulary('was_contact_made', Contact, vocabularies['was_contact_made'])
+  outcome = Vocabulary('outcome', Outcome, vocabularies['outcome'])
+
+use_rules(DEFAULT_VOCABULARIES)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import zlib
+from os.path import basename, join
+
+import click
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+from .sinks import WRITE_BUFFER_SIZE, open_sink, output_path
+
+# Written to the output directory of a sharded run
+MANIFEST = 'manifest.json'
+
+# Open files beyond the shards' own, for the input, state, worker pipes and
+# the like
+OTHER_FILES = 64
+
+# The shards of an output share WRITE_BUFFER_SIZE between their files, so
+# memory doesn't grow with the number of shards, down to this much each
+MIN_BUFFER_SIZE = 64 << 10
+
+shards_option = click.option('--shards', 'shards', type=click.IntRange(min=1),
+                             help='Split every output into this many files by a hash of '
+                                  'nhs_number, so they can be copied in parallel')
+max_rows_option = click.option('--max-rows-per-file', 'max_rows_per_file',
+                               type=click.IntRange(min=1),
+                               help='Start a new file for an output, or a shard of it, '
+                                    'after this many rows')
+
+def shard_of(nhs_number, shards):
+  """The shard a contact's rows go to. CRC-32 is the same on every machine
+     and run, unlike hash()."""
+
+  return zlib.crc32((nhs_number or '').encode()) % shards
+
+class ShardedSink:
+  """An output split into files of at most max_rows rows, with the same
+     interface as CsvSink.
+
+  Rows go to one of shards files by the hash of their nhs_number, so all of
+  a contact's rows, in every output, are in the same shard. A shard's file
+  is closed and a new one started once it has max_rows rows. Files are
+  numbered in the order they're started, as '<path>.0000.csv' and so on.
+  A shard's first file is opened with its first row, and shards without
+  any rows get an empty one on close, so every shard has at least one."""
+
+  def __init__(self, path, header, parts=1, output_format='csv', types=None,
+               compression=None, shards=1, max_rows=None):
+    self.path = path
+    self.header = header
+    self.options = {'parts': parts, 'output_format': output_format, 'types': types,
+                    'compression': compression,
+                    'buffer_size': max(WRITE_BUFFER_SIZE // shards, MIN_BUFFER_SIZE)}
+    self.shards = shards
+    self.max_rows = max_rows
+    self.nhs_number_index = header.index('nhs_number')
+    self.files = []
+    self.row_count = 0
+    self.sinks = [None] * shards
+
+  @property
+  def byte_count(self):
+    return sum(sink.byte_count or 0 for _, _, sink in self.files)
+
+  def start_file(self, shard):
+    path = output_path(f'{self.path}.{len(self.files):04}', self.options['output_format'],
+                       self.options['compression'])
+    sink = open_sink(path, self.header, **self.options)
+    self.files.append((path, shard, sink))
+    return sink
+
+  def write(self, values, part=0):
+    shard = shard_of(values[self.nhs_number_index], self.shards) if self.shards > 1 else 0
+    sink = self.sinks[shard]
+    if sink is None:
+      sink = self.sinks[shard] = self.start_file(shard)
+    elif self.max_rows and sink.row_count >= self.max_rows:
+      sink.close()
+      sink = self.sinks[shard] = self.start_file(shard)
+    sink.write(values, part)
+    self.row_count += 1
+
+  def close(self):
+    for shard, sink in enumerate(self.sinks):
+      (sink or self.start_file(shard)).close()
+
+  def abort(self):
+    for sink in self.sinks:
+      if sink:
+        sink.abort()
+
+  def manifest(self):
+    """The files written, once closed, with their shard, rows, bytes and
+       SHA-256 checksum"""
+
+    return [{'path': basename(path),
+             'shard': shard,
+             'rows': sink.row_count,
+             'bytes': os.path.getsize(path),
+             'sha256': checksum(path)}
+            for path, shard, sink in self.files]
+
+def check_open_files(shards, outputs):
+  """Makes sure every file of shards shards of outputs, which maps output
+     names to their (header, parts), can be open at once. The soft limit on
+     open files is raised to the hard one if need be, otherwise it's a
+     ClickException."""
+
+  if not resource:
+    return
+
+  needed = shards * sum(parts for _, parts in outputs.values()) + OTHER_FILES
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  if soft == resource.RLIM_INFINITY or needed <= soft:
+    return
+  if hard == resource.RLIM_INFINITY or needed <= hard:
+    resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+    return
+  raise click.ClickException(f'--shards {shards} needs up to {needed} open files, more than '
+                             f'the limit of {hard}. Use fewer shards, or raise the limit '
+                             'with ulimit -n.')
+
+def checksum(path):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+def write_manifest(output_dir, sinks, shards, max_rows):
+  """Writes MANIFEST to output_dir, listing the files of each ShardedSink in
+     sinks, by output name, and their columns for \\COPY. Returns its path."""
+
+  manifest = {'shards': shards,
+              'max_rows_per_file': max_rows,
+              'outputs': { name: {'columns': sink.header, 'files': sink.manifest()}
+                           for name, sink in sinks.items() }}
+  path = join(output_dir, MANIFEST)
+  with open(f'{path}.tmp', 'w') as f:
+    json.dump(manifest, f, indent=2)
+  os.replace(f'{path}.tmp', path)
+  return path
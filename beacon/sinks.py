@@ -0,0 +1,339 @@
+import csv
+import io
+import os
+import sys
+import shutil
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+# pyarrow, imported by the first ArrowSink as it takes a while to load
+pa = None
+
+# Output formats => file extension
+FORMATS = {'csv': 'csv', 'parquet': 'parquet', 'arrow': 'arrow'}
+
+# Compressions of CSV outputs => extension added to the file name
+COMPRESSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+
+# Rows buffered per part before they are written as a record batch
+BATCH_SIZE = 10000
+
+# Bytes buffered per CSV file before they're handed to its writer thread
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Writes pending per file before writing rows waits for the disk
+WRITE_QUEUE_SIZE = 8
+
+format_option = click.option('-f', '--format', 'output_format', default='csv', show_default=True,
+                             type=click.Choice(list(FORMATS)),
+                             help='Write CSV, or typed and compressed Parquet or Arrow IPC '
+                                  'files (needs pyarrow)')
+
+compression_option = click.option('-z', '--compress', 'compression',
+                                  type=click.Choice(list(COMPRESSIONS)),
+                                  help='Compress CSV outputs as they are written '
+                                       '(zstd needs zstandard)')
+
+def open_sink(path, header, parts=1, output_format='csv', types=None, resume_sizes=None,
+              compression=None, buffer_size=WRITE_BUFFER_SIZE):
+  """Opens a sink for the given format. types maps columns to 'date',
+     'timestamp', 'boolean' or 'bigint', and is ignored for CSV. Only CSV
+     sinks can be resumed or compressed, and use buffer_size."""
+
+  if output_format == 'csv':
+    return CsvSink(path, header, parts, resume_sizes, compression, buffer_size)
+  if compression:
+    raise click.ClickException(f'{output_format} files are already compressed, '
+                               '--compress only applies to csv')
+  return ArrowSink(path, header, parts, output_format, types)
+
+def output_path(path_without_extension, output_format, compression=None):
+  path = f'{path_without_extension}.{FORMATS[output_format]}'
+  return f'{path}.{COMPRESSIONS[compression]}' if compression else path
+
+def compressor_factory(compression):
+  """Returns a function that makes a new compressor for compression, or None.
+     The output of successive compressors can be concatenated: gzip members
+     and zstd frames both decompress as one file."""
+
+  if compression == 'gzip':
+    return lambda: zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+  if compression == 'zstd':
+    try:
+      import zstandard
+    except ImportError:
+      raise click.ClickException('Compressing with zstd requires zstandard, '
+                                 'install with: pip3 install "beacon-data-importer[zstd]"')
+    return lambda: zstandard.ZstdCompressor().compressobj()
+  return None
+
+def format_bytes(count):
+  for unit in ['bytes', 'KB', 'MB']:
+    if count < 1024:
+      return f'{count:.0f} {unit}' if unit == 'bytes' else f'{count:.1f} {unit}'
+    count /= 1024
+  return f'{count:.1f} GB'
+
+class CsvSink:
+  """A CSV output file that can be fed rows from several tables at once.
+
+  Rows for the first part are written straight to the file. Rows for later
+  parts are spooled to '<path>.part<n>' files and appended in order on close,
+  which gives the same result as etl.cat() without reading the input again.
+
+  Each file is buffered in buffer_size blocks and written by its own
+  BackgroundWriter thread, so the disk and any compression keep up with the
+  rows rather than holding them up. Spools aren't compressed.
+
+  The files can be checkpointed: flush() writes out what's buffered and
+  sizes() returns the size of each file. Passing those sizes back as
+  resume_sizes reopens the files of an aborted run, cut back to them.
+
+  A path of '-' writes to stdout, and spools to temporary files."""
+
+  def __init__(self, path, header, parts=1, resume_sizes=None, compression=None,
+               buffer_size=WRITE_BUFFER_SIZE):
+    if path == '-':
+      files = [open(sys.stdout.fileno(), 'wb', closefd=False),
+               *(tempfile.TemporaryFile('w+b') for _ in range(parts - 1))]
+    else:
+      paths = [path, *(f'{path}.part{part}' for part in range(1, parts))]
+      if resume_sizes:
+        files = [reopen(file_path, size) for file_path, size in zip(paths, resume_sizes)]
+      else:
+        files = [open(file_path, 'w+b') for file_path in paths]
+
+    self.outputs = [BackgroundWriter(files[0], compressor_factory(compression)),
+                    *(BackgroundWriter(f) for f in files[1:])]
+    self.file, *self.spools = [io.TextIOWrapper(io.BufferedWriter(output, buffer_size),
+                                                newline='')
+                               for output in self.outputs]
+    self.writers = [csv.writer(f) for f in [self.file, *self.spools]]
+    self.row_count = 0
+    if not resume_sizes:
+      self.writers[0].writerow(header)
+
+  @property
+  def byte_count(self):
+    return self.outputs[0].bytes_out
+
+  def write(self, values, part=0):
+    self.writers[part].writerow(values)
+    self.row_count += 1
+
+  def flush(self):
+    for f in [self.file, *self.spools]:
+      f.flush()
+    for output in self.outputs:
+      output.end_frame()
+
+  def sizes(self):
+    return [output.tell() for output in self.outputs]
+
+  def close(self):
+    self.file.flush()
+    for spool, output in zip(self.spools, self.outputs[1:]):
+      # Flushing the buffers doesn't wait for the writer
+      spool.flush()
+      output.flush()
+      output.file.seek(0)
+      shutil.copyfileobj(output.file, self.file.buffer, WRITE_BUFFER_SIZE)
+      name = output.file.name
+      spool.close()
+      if isinstance(name, str):
+        os.remove(name)
+    self.file.close()
+
+  def abort(self):
+    """Closes the files as they are, leaving the spools for a resumed run"""
+
+    for f in [self.file, *self.spools]:
+      f.close()
+
+def reopen(path, size):
+  """Opens a file for appending, after cutting it back to size"""
+
+  with open(path, 'r+b') as f:
+    f.truncate(size)
+  return open(path, 'a+b')
+
+class BackgroundWriter(io.RawIOBase):
+  """A binary file that's written to by a thread of its own, so formatting
+     rows and writing them out overlap.
+
+  At most WRITE_QUEUE_SIZE writes are pending, so a slow disk holds up the
+  writer rather than filling memory. Given new_compressor, the bytes are
+  compressed on the thread too, and end_frame() finishes the compressed
+  frame so far, leaving the file at a point it can be cut back to. Errors
+  on the thread are raised by a later write or flush."""
+
+  def __init__(self, file, new_compressor=None):
+    super().__init__()
+    self.file = file
+    self.new_compressor = new_compressor
+    self.compressor = new_compressor() if new_compressor else None
+    self.bytes_in = 0
+    self.bytes_out = 0
+    # A single thread keeps the writes in order
+    self.executor = ThreadPoolExecutor(1)
+    self.pending = deque()
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    # The caller reuses its buffer
+    data = bytes(data)
+    self._submit(self._write, data)
+    self.bytes_in += len(data)
+    return len(data)
+
+  def end_frame(self):
+    if self.compressor:
+      self._submit(self._end_frame)
+    self.flush()
+
+  def flush(self):
+    while self.pending:
+      self.pending.popleft().result()
+    if not self.closed:
+      self.file.flush()
+
+  def tell(self):
+    self.flush()
+    return self.file.tell()
+
+  def close(self):
+    if self.closed:
+      return
+    try:
+      self.flush()
+      if self.compressor:
+        self._write_out(self.compressor.flush())
+    finally:
+      # shutdown(cancel_futures=True) needs Python 3.9
+      for future in self.pending:
+        future.cancel()
+      self.pending.clear()
+      self.executor.shutdown()
+      try:
+        super().close()
+      finally:
+        self.file.close()
+
+  def _submit(self, func, *args):
+    self.pending.append(self.executor.submit(func, *args))
+    if len(self.pending) > WRITE_QUEUE_SIZE:
+      self.pending.popleft().result()
+
+  def _write(self, data):
+    if self.compressor:
+      data = self.compressor.compress(data)
+    self._write_out(data)
+
+  def _end_frame(self):
+    self._write_out(self.compressor.flush())
+    self.compressor = self.new_compressor()
+
+  def _write_out(self, data):
+    self.file.write(data)
+    self.bytes_out += len(data)
+
+class ArrowSink:
+  """A Parquet or Arrow IPC output file, with the same interface as CsvSink.
+
+  Rows are buffered per part and written as zstd compressed record batches
+  of BATCH_SIZE rows, so memory is bounded by the batch size. As with
+  CsvSink, later parts are spooled, here as Arrow IPC streams, and appended
+  in order on close."""
+
+  def __init__(self, path, header, parts=1, output_format='parquet', types=None):
+    global pa
+    if pa is None:
+      try:
+        import pyarrow as pa
+      except ImportError:
+        raise click.ClickException(f'Writing {output_format} files requires pyarrow, '
+                                   'install with: pip3 install "beacon-data-importer[arrow]"')
+
+    self.header = header
+    types = types or {}
+    self.schema = pa.schema([(field, ARROW_TYPES[types.get(field, 'text')]())
+                             for field in header])
+    self.file = (open(sys.stdout.fileno(), 'wb', closefd=False)
+                 if path == '-'
+                 else open(path, 'wb'))
+    if output_format == 'parquet':
+      import pyarrow.parquet as pq
+      self.writer = pq.ParquetWriter(self.file, self.schema, compression='zstd')
+    else:
+      self.writer = pa.ipc.new_file(self.file, self.schema, options=ipc_options())
+
+    self.spools = [tempfile.TemporaryFile('w+b') for _ in range(parts - 1)]
+    self.writers = [self.writer, *(pa.ipc.new_stream(spool, self.schema, options=ipc_options())
+                                   for spool in self.spools)]
+    self.buffers = [[] for _ in range(parts)]
+    self.row_count = 0
+    self.byte_count = None
+
+  def write(self, values, part=0):
+    buffer = self.buffers[part]
+    buffer.append(values)
+    self.row_count += 1
+    if len(buffer) >= BATCH_SIZE:
+      self.flush(part)
+
+  def flush(self, part):
+    if self.buffers[part]:
+      self.writers[part].write_batch(self.record_batch(self.buffers[part]))
+      self.buffers[part] = []
+
+  def record_batch(self, rows):
+    columns = zip(*rows)
+    return pa.record_batch([to_array(values, field.type)
+                            for values, field in zip(columns, self.schema)],
+                           schema=self.schema)
+
+  def close(self):
+    for part in range(len(self.buffers)):
+      self.flush(part)
+
+    for writer, spool in zip(self.writers[1:], self.spools):
+      writer.close()
+      spool.seek(0)
+      for batch in pa.ipc.open_stream(spool):
+        self.writer.write_batch(batch)
+      spool.close()
+
+    self.writer.close()
+    if self.file.seekable():
+      self.byte_count = self.file.tell()
+    self.file.close()
+
+  def abort(self):
+    for spool in self.spools:
+      spool.close()
+    self.file.close()
+
+def ipc_options():
+  return pa.ipc.IpcWriteOptions(compression='zstd')
+
+ARROW_TYPES = {
+  'text': lambda: pa.string(),
+  'date': lambda: pa.date32(),
+  'timestamp': lambda: pa.timestamp('us'),
+  'boolean': lambda: pa.bool_(),
+  'bigint': lambda: pa.int64()
+}
+
+def to_array(values, arrow_type):
+  # Dates arrive as ISO strings, or occasionally date objects, so both are
+  # cast from their string form
+  if pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type):
+    strings = [str(value) if value not in (None, '') else None for value in values]
+    return pa.array(strings, pa.string()).cast(arrow_type)
+  return pa.array(values, arrow_type)
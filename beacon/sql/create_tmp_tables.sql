@@ -1,25 +1,29 @@
+-- Unlogged, since they're only loaded once and dropped after the import.
+-- Indexes are added by prepare_import.sql, once they've been loaded.
 DROP TABLE IF EXISTS tmp_original_triage_needs;
-CREATE TABLE tmp_original_triage_needs (
+CREATE UNLOGGED TABLE tmp_original_triage_needs (
   nhs_number text NOT NULL,
   category text NOT NULL,
   name text NOT NULL,
   created_at date NOT NULL,
   updated_at date NOT NULL,
-  completed_on date
+  completed_on date,
+  source_row bigint NOT NULL
 );
 
 DROP TABLE IF EXISTS tmp_original_triage_notes;
-CREATE TABLE tmp_original_triage_notes (
+CREATE UNLOGGED TABLE tmp_original_triage_notes (
   nhs_number text NOT NULL,
   category text NOT NULL,
   body text NOT NULL,
   created_at date NOT NULL,
   updated_at date NOT NULL,
-  import_data jsonb
+  import_data jsonb,
+  source_row bigint NOT NULL
 );
 
 DROP TABLE IF EXISTS tmp_identified_needs;
-CREATE TABLE tmp_identified_needs (
+CREATE UNLOGGED TABLE tmp_identified_needs (
   nhs_number text NOT NULL,
   category text NOT NULL,
   name text,
@@ -32,10 +36,18 @@ CREATE TABLE tmp_identified_needs (
 );
 
 DROP TABLE IF EXISTS tmp_contact_profile_updates;
-CREATE TABLE tmp_contact_profile_updates (
+CREATE UNLOGGED TABLE tmp_contact_profile_updates (
   nhs_number text NOT NULL,
   additional_info text,
   delivery_details text,
   dietary_details text,
-  has_covid_symptoms boolean
+  has_covid_symptoms boolean,
+  source_row bigint NOT NULL
+);
+
+-- The range of nhs_numbers the import scripts work on
+DROP TABLE IF EXISTS tmp_import_batch;
+CREATE UNLOGGED TABLE tmp_import_batch (
+  first_nhs_number text NOT NULL,
+  last_nhs_number text NOT NULL
 );
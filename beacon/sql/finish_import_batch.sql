@@ -0,0 +1,15 @@
+-- Run in the same transaction as the import scripts, so that once a batch
+-- is committed its rows are gone from the loading tables, and whatever is
+-- left there hasn't been imported.
+DELETE FROM tmp_original_triage_needs AS tmp
+  USING tmp_import_batch AS batch
+  WHERE tmp.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number;
+DELETE FROM tmp_original_triage_notes AS tmp
+  USING tmp_import_batch AS batch
+  WHERE tmp.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number;
+DELETE FROM tmp_identified_needs AS tmp
+  USING tmp_import_batch AS batch
+  WHERE tmp.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number;
+DELETE FROM tmp_contact_profile_updates AS tmp
+  USING tmp_import_batch AS batch
+  WHERE tmp.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number;
@@ -0,0 +1,24 @@
+-- A contact can have several call log rows, so the value of each field from
+-- the last row that has one wins
+WITH tmp_updates AS (
+  SELECT tmp_updates.nhs_number,
+         (array_agg(additional_info ORDER BY source_row DESC)
+            FILTER (WHERE additional_info IS NOT NULL))[1] AS additional_info,
+         (array_agg(delivery_details ORDER BY source_row DESC)
+            FILTER (WHERE delivery_details IS NOT NULL))[1] AS delivery_details,
+         (array_agg(dietary_details ORDER BY source_row DESC)
+            FILTER (WHERE dietary_details IS NOT NULL))[1] AS dietary_details,
+         (array_agg(has_covid_symptoms ORDER BY source_row DESC)
+            FILTER (WHERE has_covid_symptoms IS NOT NULL))[1] AS has_covid_symptoms
+  FROM tmp_contact_profile_updates AS tmp_updates
+  JOIN tmp_import_batch AS batch
+    ON tmp_updates.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number
+  GROUP BY tmp_updates.nhs_number
+)
+UPDATE contacts
+SET additional_info = COALESCE(tmp_updates.additional_info, contacts.additional_info),
+    delivery_details = COALESCE(tmp_updates.delivery_details, contacts.delivery_details),
+    dietary_details = COALESCE(tmp_updates.dietary_details, contacts.dietary_details),
+    has_covid_symptoms = COALESCE(tmp_updates.has_covid_symptoms, contacts.has_covid_symptoms)
+FROM tmp_updates
+WHERE tmp_updates.nhs_number = contacts.nhs_number;
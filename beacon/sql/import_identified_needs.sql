@@ -1,8 +1,3 @@
-WITH contacts_map AS (
-  SELECT id AS contact_id,
-         nhs_number
-  FROM contacts
-)
 INSERT INTO needs (contact_id,
                    category,
                    name,
@@ -12,7 +7,7 @@ INSERT INTO needs (contact_id,
                    supplemental_data,
                    user_id,
                    start_on)
-  SELECT contacts_map.contact_id,
+  SELECT contacts.id,
           tmp_needs.category,
           tmp_needs.name,
           tmp_needs.created_at,
@@ -22,6 +17,8 @@ INSERT INTO needs (contact_id,
           tmp_needs.user_id,
           tmp_needs.start_on
   FROM tmp_identified_needs AS tmp_needs
-  JOIN contacts_map
-    ON contacts_map.nhs_number = tmp_needs.nhs_number
+  JOIN tmp_import_batch AS batch
+    ON tmp_needs.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number
+  JOIN contacts
+    ON contacts.nhs_number = tmp_needs.nhs_number
 ;
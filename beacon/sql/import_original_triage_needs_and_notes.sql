@@ -0,0 +1,49 @@
+-- Needs are given their ids up front, so each note can be joined to the
+-- need from its own call log row by source_row
+WITH batch_needs AS (
+  SELECT nextval(pg_get_serial_sequence('needs', 'id')) AS id,
+         contacts.id AS contact_id,
+         tmp_needs.category,
+         tmp_needs.name,
+         tmp_needs.created_at,
+         tmp_needs.updated_at,
+         tmp_needs.completed_on,
+         tmp_needs.source_row
+  FROM tmp_original_triage_needs AS tmp_needs
+  JOIN tmp_import_batch AS batch
+    ON tmp_needs.nhs_number BETWEEN batch.first_nhs_number AND batch.last_nhs_number
+  JOIN contacts
+    ON contacts.nhs_number = tmp_needs.nhs_number
+), inserted_needs AS (
+  INSERT INTO needs (id,
+                     contact_id,
+                     category,
+                     name,
+                     created_at,
+                     updated_at,
+                     completed_on)
+    SELECT id,
+           contact_id,
+           category,
+           name,
+           created_at,
+           updated_at,
+           completed_on
+    FROM batch_needs
+)
+INSERT into notes (need_id,
+                   category,
+                   body,
+                   created_at,
+                   updated_at,
+                   import_data)
+  SELECT batch_needs.id,
+         tmp_notes.category,
+         tmp_notes.body,
+         tmp_notes.created_at,
+         tmp_notes.updated_at,
+         tmp_notes.import_data
+  FROM tmp_original_triage_notes AS tmp_notes
+  JOIN batch_needs
+    ON batch_needs.source_row = tmp_notes.source_row
+;
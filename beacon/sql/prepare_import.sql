@@ -0,0 +1,21 @@
+-- Run once the temporary loading tables are filled. Building the indexes
+-- after the load is quicker than maintaining them during it.
+CREATE INDEX ON tmp_original_triage_needs (nhs_number);
+CREATE INDEX ON tmp_original_triage_notes (source_row);
+CREATE INDEX ON tmp_original_triage_notes (nhs_number);
+CREATE INDEX ON tmp_identified_needs (nhs_number);
+CREATE INDEX ON tmp_contact_profile_updates (nhs_number);
+
+-- Every output row comes from a call log row with an original triage need,
+-- so this range covers them all. load-calls --import-batch-size narrows it.
+DELETE FROM tmp_import_batch;
+INSERT INTO tmp_import_batch (first_nhs_number, last_nhs_number)
+  SELECT min(nhs_number), max(nhs_number)
+  FROM tmp_original_triage_needs
+  HAVING count(*) > 0;
+
+ANALYZE tmp_original_triage_needs,
+        tmp_original_triage_notes,
+        tmp_identified_needs,
+        tmp_contact_profile_updates,
+        tmp_import_batch;
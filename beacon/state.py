@@ -0,0 +1,131 @@
+import hashlib
+import sqlite3
+
+class ImportState:
+  """Records which call log rows have been prepared, in a local SQLite file,
+     so a cumulative export can be prepared incrementally.
+
+  Rows are keyed on nhs_number and attempt date, so an attempt is only
+  prepared once. A fingerprint of the whole row is kept with it, and rows
+  that have been edited since are counted in changed_count rather than
+  prepared again, which would import a second set of needs and notes for
+  the attempt. Rows seen during a run are
+  only recorded by commit(), once their outputs have been written. Until
+  then they're pending, by source_row, and kept by checkpoint() for a
+  resumed run. Rejected rows are released, so the next run tries them
+  again."""
+
+  def __init__(self, path, resume=False):
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript('''
+      CREATE TABLE IF NOT EXISTS prepared_rows (
+        nhs_number TEXT NOT NULL,
+        attempt_date TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        PRIMARY KEY (nhs_number, attempt_date)
+      ) WITHOUT ROWID;
+    ''')
+    self.migrate()
+    if not resume:
+      # Pending rows only last a run, so older layouts can be replaced
+      with self.connection:
+        self.connection.execute('DROP TABLE IF EXISTS pending_rows')
+    self.connection.execute('''
+      CREATE TABLE IF NOT EXISTS pending_rows (
+        source_row INTEGER PRIMARY KEY,
+        nhs_number TEXT NOT NULL,
+        attempt_date TEXT NOT NULL,
+        fingerprint TEXT NOT NULL
+      )
+    ''')
+    self.connection.execute('CREATE INDEX IF NOT EXISTS pending_contacts ON pending_rows (nhs_number)')
+    self.skipped_count = 0
+    self.changed_count = 0
+
+  def migrate(self):
+    """Re-keys the prepared rows of a state file from before the fingerprint
+       was left out of the key, keeping the first fingerprint of each attempt"""
+
+    key = [column for _, column, _, _, _, pk in
+           self.connection.execute('PRAGMA table_info(prepared_rows)') if pk]
+    if 'fingerprint' not in key:
+      return
+    with self.connection:
+      self.connection.executescript('''
+        ALTER TABLE prepared_rows RENAME TO old_prepared_rows;
+        CREATE TABLE prepared_rows (
+          nhs_number TEXT NOT NULL,
+          attempt_date TEXT NOT NULL,
+          fingerprint TEXT NOT NULL,
+          PRIMARY KEY (nhs_number, attempt_date)
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO prepared_rows SELECT * FROM old_prepared_rows;
+        DROP TABLE old_prepared_rows;
+      ''')
+
+  def select_new(self, fields, rows):
+    """Yields the (source_row, values) rows whose attempts weren't prepared
+       by a previous run"""
+
+    nhs_number_index = fields.index('nhs_number')
+    attempt_date_index = fields.index('latest_attempt_date')
+    for source_row, values in rows:
+      key = (values[nhs_number_index],
+             values[attempt_date_index],
+             fingerprint(values))
+      prepared = self.connection.execute('''
+        SELECT fingerprint FROM prepared_rows
+        WHERE nhs_number = ? AND attempt_date = ?
+      ''', key[:2]).fetchone()
+      if prepared:
+        if prepared[0] == key[2]:
+          self.skipped_count += 1
+        else:
+          self.changed_count += 1
+        continue
+
+      self.connection.execute('INSERT OR REPLACE INTO pending_rows VALUES (?, ?, ?, ?)',
+                              (source_row, *key))
+      yield source_row, values
+
+  def release(self, source_row, contact=False):
+    """Forgets a pending row, or with contact every pending row of its
+       contact, so it isn't recorded as prepared"""
+
+    if contact:
+      self.connection.execute('''
+        DELETE FROM pending_rows
+        WHERE nhs_number = (SELECT nhs_number FROM pending_rows WHERE source_row = ?)
+      ''', (source_row,))
+    else:
+      self.connection.execute('DELETE FROM pending_rows WHERE source_row = ?', (source_row,))
+
+  def commit_contacts(self, nhs_numbers):
+    """Records the pending rows of the contacts with nhs_numbers, for an
+       import that commits a batch of contacts at a time"""
+
+    params = [(nhs_number,) for nhs_number in nhs_numbers]
+    with self.connection:
+      self.connection.executemany('''
+        INSERT OR IGNORE INTO prepared_rows
+        SELECT nhs_number, attempt_date, fingerprint FROM pending_rows
+        WHERE nhs_number = ?
+      ''', params)
+      self.connection.executemany('DELETE FROM pending_rows WHERE nhs_number = ?', params)
+
+  def checkpoint(self):
+    self.connection.commit()
+
+  def commit(self):
+    with self.connection:
+      self.connection.execute('''
+        INSERT OR IGNORE INTO prepared_rows
+        SELECT nhs_number, attempt_date, fingerprint FROM pending_rows
+      ''')
+      self.connection.execute('DELETE FROM pending_rows')
+
+  def close(self):
+    self.connection.close()
+
+def fingerprint(values):
+  return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).hexdigest()
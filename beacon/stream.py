@@ -0,0 +1,118 @@
+import io
+import json
+import sys
+
+import click
+
+from .reader import open_input
+from .sinks import BackgroundWriter, WRITE_BUFFER_SIZE, compressor_factory
+
+class OutputStream:
+  """Every output of a run multiplexed into one stream of JSON lines on
+     stdout, so prepare-calls can be piped into load-prepared without writing
+     the files.
+
+  Each output starts with a line of {"output": name, "header": [...]}, and
+  each of its rows is a line of [name, [values...]]. Rows of an output's
+  parts are interleaved, in the order they were prepared. Once every sink
+  is closed, a line of {"end": {name: row_count}} marks the stream complete,
+  and it's closed with any compression finished. If any sink was aborted,
+  the stream is closed without it, so a reader can tell it's cut short."""
+
+  def __init__(self, compression=None):
+    self.output = BackgroundWriter(open(sys.stdout.fileno(), 'wb', closefd=False),
+                                   compressor_factory(compression))
+    self.file = io.TextIOWrapper(io.BufferedWriter(self.output, WRITE_BUFFER_SIZE),
+                                 encoding='utf-8', newline='')
+    self.sinks = []
+    self.open_sinks = 0
+    self.aborted = False
+
+  def sink(self, name, header):
+    self.file.write(json.dumps({'output': name, 'header': header}) + '\n')
+    sink = StreamSink(self, name)
+    self.sinks.append(sink)
+    self.open_sinks += 1
+    return sink
+
+  def release(self, aborted=False):
+    self.aborted = self.aborted or aborted
+    self.open_sinks -= 1
+    if not self.open_sinks:
+      if not self.aborted:
+        counts = { sink.name: sink.row_count for sink in self.sinks }
+        self.file.write(json.dumps({'end': counts}) + '\n')
+      self.file.close()
+
+class StreamSink:
+  """The rows of one output in an OutputStream, with the same interface as
+     CsvSink"""
+
+  def __init__(self, stream, name):
+    self.stream = stream
+    self.name = name
+    self.prefix = f'[{json.dumps(name)},'
+    self.row_count = 0
+    self.byte_count = 0
+    self.closed = False
+
+  def write(self, values, part=0):
+    line = f'{self.prefix}{json.dumps(values, default=str)}]\n'
+    self.stream.file.write(line)
+    self.row_count += 1
+    self.byte_count += len(line)
+
+  def flush(self):
+    self.stream.file.flush()
+
+  def close(self):
+    if not self.closed:
+      self.closed = True
+      self.stream.release()
+
+  def abort(self):
+    if not self.closed:
+      self.closed = True
+      self.stream.release(aborted=True)
+
+def read_stream(path, outputs):
+  """Returns an iterator over (output name, part, values) for the rows of a
+     stream written by OutputStream, from path or stdin for '-'. outputs maps
+     output names to their (header, parts), which the stream's headers have
+     to match.
+
+  The stream has to end with the row counts of a complete run, so a stream
+  that was cut short raises a ClickException after its last row."""
+
+  counts = {}
+  with io.TextIOWrapper(open_input(path), encoding='utf-8', newline='') as file:
+    for line in file:
+      record = json.loads(line)
+      if isinstance(record, dict) and 'end' in record:
+        check_counts(path, outputs, counts, record['end'])
+        if next(file, None) is not None:
+          raise click.ClickException(f'{path} has more lines after its end')
+        return
+      if isinstance(record, dict):
+        name = record['output']
+        if name not in outputs or record['header'] != outputs[name][0]:
+          raise click.ClickException(f'The {name} output of {path} doesn\'t match this '
+                                     'version of beacon, prepare it again')
+        counts[name] = 0
+        continue
+      name, values = record
+      if name not in counts:
+        raise click.ClickException(f'{path} has {name} rows before its header')
+      counts[name] += 1
+      yield name, 0, values
+
+  raise click.ClickException(f'{path} ends before prepare-calls finished, '
+                             'so it\'s incomplete and wasn\'t imported')
+
+def check_counts(path, outputs, counts, expected):
+  missing = [name for name in outputs if name not in counts]
+  if missing:
+    raise click.ClickException(f"{path} has no {', '.join(missing)} output, prepare it again")
+  if counts != expected:
+    raise click.ClickException(f'{path} has different row counts from the ones prepare-calls '
+                               f'wrote, {counts} rather than {expected}')
@@ -0,0 +1,65 @@
+"""Times consolidating a call log's rows by contact, in memory and spilling
+sorted runs to disk, then prepare-calls with and without --consolidate.
+
+  python -m benchmarks.consolidate --rows 100000 --run-size 10000
+
+--run-size is the rows sorted in memory at a time by the spilling run.
+"""
+import csv
+import glob
+import os
+import tempfile
+import timeit
+from os.path import join
+
+import click
+
+from beacon.consolidate import Consolidation, RUN_SIZE
+from beacon.prepare_calls import PROFILE_FIELD_INDEXES, attempt_key, read_spreadsheet
+from benchmarks.run import USERS, run_command
+from benchmarks.synthetic import write_calls_file
+
+def consolidate(calls_path, run_size):
+  _, reader = read_spreadsheet(calls_path)
+  consolidation = Consolidation(run_size)
+  for _ in consolidation.consolidate(enumerate(reader, 1), attempt_key,
+                                     PROFILE_FIELD_INDEXES):
+    pass
+  return consolidation
+
+def count_rows(output_dir):
+  total = 0
+  for path in glob.glob(join(output_dir, '*.csv')):
+    with open(path, newline='') as f:
+      total += sum(1 for _ in csv.reader(f)) - 1
+  return total
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+@click.option('--run-size', default=10000, show_default=True)
+def main(rows, run_size):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    calls_path = join(tmp_dir, 'calls.csv')
+    write_calls_file(calls_path, rows)
+
+    for label, size in [('in memory', max(rows + 1, RUN_SIZE)), ('spilled', run_size)]:
+      consolidation = None
+      def run():
+        nonlocal consolidation
+        consolidation = consolidate(calls_path, size)
+      seconds = min(timeit.repeat(run, number=1, repeat=3))
+      click.echo(f'Consolidated {consolidation.row_count} rows into '
+                 f'{consolidation.contact_count} contacts {label} '
+                 f'({consolidation.spilled_runs} runs on disk) at '
+                 f'{consolidation.row_count / seconds:.0f} rows/s')
+
+    output_dir = join(tmp_dir, 'output')
+    os.mkdir(output_dir)
+    for args in [[], ['--consolidate']]:
+      seconds, peak_rss_kb = run_command(['prepare-calls', *USERS, '--output-dir', output_dir,
+                                          *args, calls_path], quiet=True)
+      click.echo(f"prepare-calls {' '.join(args)}: {seconds:.2f}s, "
+                 f'peak RSS {peak_rss_kb / 1024:.0f} MB, {count_rows(output_dir)} rows written')
+
+if __name__ == '__main__':
+  main()
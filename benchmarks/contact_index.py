@@ -0,0 +1,50 @@
+"""Times building a contact index and looking NHS numbers up in it, then the
+prepare-calls run it saves when only some of the call log's contacts exist.
+
+  python -m benchmarks.contact_index --contacts 1000000 --rows 100000 --known 0.5
+
+--known is the share of call log contacts that are in the index.
+"""
+import tempfile
+import timeit
+from os.path import join
+
+import click
+
+from beacon.contact_index import ContactIndex, write_index
+from benchmarks.run import USERS, run_command
+from benchmarks.synthetic import FIRST_NHS_NUMBER, write_calls_file
+
+@click.command()
+@click.option('--contacts', default=1000000, show_default=True)
+@click.option('--rows', default=100000, show_default=True)
+@click.option('--known', default=0.5, show_default=True)
+def main(contacts, rows, known):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    index_path = join(tmp_dir, 'contacts.idx')
+    calls_path = join(tmp_dir, 'calls.csv')
+
+    # The call log's contacts are numbered from FIRST_NHS_NUMBER, so the
+    # index holds the first share of them and the rest are made up
+    known_count = int(rows * known)
+    nhs_numbers = [str(FIRST_NHS_NUMBER + i) for i in range(known_count)]
+    nhs_numbers += [str(FIRST_NHS_NUMBER - i - 1) for i in range(contacts - known_count)]
+    seconds = min(timeit.repeat(lambda: write_index(index_path, nhs_numbers), number=1, repeat=1))
+    click.echo(f'Indexed {contacts} contacts in {seconds:.2f}s')
+
+    index = ContactIndex(index_path)
+    lookups = [str(FIRST_NHS_NUMBER + i) for i in range(rows)]
+    seconds = min(timeit.repeat(lambda: [nhs_number in index for nhs_number in lookups],
+                                number=1, repeat=3))
+    click.echo(f'Looked up {rows} NHS numbers at {rows / seconds:.0f}/s')
+    index.close()
+
+    write_calls_file(calls_path, rows)
+    args = ['prepare-calls', *USERS, '--output-dir', tmp_dir, calls_path]
+    without_index, _ = run_command(args)
+    with_index, _ = run_command([*args, '--contact-index', index_path])
+    click.echo(f'prepare-calls: {without_index:.2f}s without the index, '
+               f'{with_index:.2f}s with it')
+
+if __name__ == '__main__':
+  main()
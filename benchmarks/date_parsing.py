@@ -0,0 +1,55 @@
+"""Compares the cached date parsers with plain strptime parsing.
+
+  python -m benchmarks.date_parsing --rows 100000
+"""
+import random
+import re
+import timeit
+from functools import partial
+from datetime import datetime
+
+import click
+
+from beacon.helpers import parse_date, try_convert
+from beacon.prepare_calls import parse_callback_date
+
+# The implementations before caching and the fast paths were added
+def strptime_parse_date(value):
+  return datetime.strptime(value, '%d/%m/%Y').date().isoformat()
+
+def strptime_parse_callback_date(value):
+  date_like_string = re.search(r'(\d+[/\.]\d+[/\.]\d+)', value).group(1)
+  for fmt in ['%d/%m/%Y', '%d.%m.%y']:
+    try:
+      return datetime.strptime(date_like_string, fmt).date().isoformat()
+    except ValueError:
+      pass
+
+def sample_values(rows, days=200):
+  random.seed(rows)
+  dates = [f'{random.randint(1, 28)}/{random.randint(1, 12):02}/2020' for _ in range(days)]
+  callbacks = [f'Call on {random.randint(1, 28):02}.{random.randint(1, 12):02}.20' for _ in range(days)]
+  no_dates = ['next week', 'No', 'Not needed', 'Call back Friday', '']
+  return ([random.choice(dates) for _ in range(rows)],
+          [random.choice(callbacks + dates + no_dates * 20) for _ in range(rows)])
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+def main(rows):
+  dates, callbacks = sample_values(rows)
+  cases = [
+    ('parse_date', strptime_parse_date, parse_date, dates),
+    # As the rules call it, since values without a date used to raise
+    ('parse_callback_date', partial(try_convert, strptime_parse_callback_date),
+     partial(try_convert, parse_callback_date), callbacks),
+  ]
+
+  click.echo(f'{"function":<20} {"strptime s":>10} {"cached s":>10} {"speedup":>8}')
+  for name, before, after, values in cases:
+    assert list(map(before, values)) == list(map(after, values))
+    before_time = timeit.timeit(lambda: list(map(before, values)), number=1)
+    after_time = timeit.timeit(lambda: list(map(after, values)), number=1)
+    click.echo(f'{name:<20} {before_time:>10.3f} {after_time:>10.3f} {before_time / after_time:>7.1f}x')
+
+if __name__ == '__main__':
+  main()
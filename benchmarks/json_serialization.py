@@ -0,0 +1,58 @@
+"""Compares serialize_row with the json.dumps(dict(zip(keys, row))) it
+replaced, on the rows of a synthetic call log. orjson is timed as well when
+it's installed, for reference.
+
+  python -m benchmarks.json_serialization --rows 100000
+"""
+import json
+import tempfile
+import timeit
+from os.path import join
+
+import click
+
+from beacon.calls_header_map import rename_map
+from beacon.helpers import serialize_row
+from beacon.prepare_calls import IMPORT_DATA_KEYS
+from beacon.reader import read_columns
+from benchmarks.synthetic import write_calls_file
+
+# The implementation before the keys were encoded up front
+def dumps_serialize_row(row, keys):
+  return json.dumps(dict(zip(keys, row)))
+
+def orjson_serialize_row(row, keys):
+  import orjson
+  return orjson.dumps(dict(zip(keys, row))).decode()
+
+def read_rows(rows):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    input_path = join(tmp_dir, 'calls.csv')
+    write_calls_file(input_path, rows)
+    _, values = read_columns(input_path, rename_map, encoding='windows-1252')
+    return list(values)
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+def main(rows):
+  values = read_rows(rows)
+  cases = [('json.dumps', dumps_serialize_row), ('serialize_row', serialize_row)]
+  try:
+    import orjson
+    cases.append(('orjson', orjson_serialize_row))
+  except ImportError:
+    pass
+
+  for row in values[:1000]:
+    assert serialize_row(row, IMPORT_DATA_KEYS) == dumps_serialize_row(row, IMPORT_DATA_KEYS)
+
+  click.echo(f'{"encoder":<15} {"seconds":>8} {"rows/s":>10} {"speedup":>8}')
+  baseline = None
+  for name, serialize in cases:
+    seconds = min(timeit.repeat(lambda: [serialize(row, IMPORT_DATA_KEYS) for row in values],
+                                number=1, repeat=3))
+    baseline = baseline or seconds
+    click.echo(f'{name:<15} {seconds:>8.3f} {rows / seconds:>10.0f} {baseline / seconds:>7.1f}x')
+
+if __name__ == '__main__':
+  main()
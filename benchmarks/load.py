@@ -0,0 +1,117 @@
+"""Times each step of load-calls against a Postgres database, importing in one
+transaction and in nhs_number batches.
+
+  python -m benchmarks.load --rows 100000 --database-url postgresql://localhost/beacon_test
+  python -m benchmarks.load --rows 1000000 --import-batch-sizes 0,50000
+
+Tables are created in a beacon_benchmark schema, which is dropped first, so
+the application's own tables are never touched. Its contacts, needs and
+notes tables only have the columns the importer uses, and contacts are
+indexed on nhs_number as the application's are.
+"""
+import tempfile
+import time
+from contextlib import contextmanager
+from os.path import join
+
+import click
+
+from beacon.load import (copy_outputs, drop_tmp_tables, import_in_batches,
+                         run_import_scripts, run_script, CopySink)
+from beacon.prepare_calls import generate_outputs
+from beacon.prepare_contacts import CONTACT_FIELDS, generate_contacts
+from benchmarks.synthetic import write_calls_file, write_gds_file
+
+SCHEMA = 'beacon_benchmark'
+
+USERS = {'food_needs_user': 1, 'complex_needs_user': 2,
+         'simple_needs_user': 3, 'call_log_review_user': 4}
+
+CREATE_SCHEMA = f'''
+  DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+  CREATE SCHEMA {SCHEMA};
+  CREATE TABLE {SCHEMA}.contacts (id bigserial PRIMARY KEY, nhs_number text,
+    first_name text, middle_names text, surname text, address text, postcode text,
+    telephone text, mobile text, date_of_birth date, created_at timestamp,
+    updated_at timestamp, gds_import_data jsonb, additional_info text,
+    delivery_details text, dietary_details text, has_covid_symptoms boolean);
+  CREATE INDEX ON {SCHEMA}.contacts (nhs_number);
+  CREATE TABLE {SCHEMA}.needs (id bigserial PRIMARY KEY, contact_id bigint REFERENCES {SCHEMA}.contacts,
+    category text, name text, created_at timestamp, updated_at timestamp,
+    completed_on date, supplemental_data jsonb, user_id bigint, start_on date);
+  CREATE TABLE {SCHEMA}.notes (id bigserial PRIMARY KEY, need_id bigint REFERENCES {SCHEMA}.needs,
+    category text, body text, created_at timestamp, updated_at timestamp,
+    import_data jsonb);
+'''
+
+@contextmanager
+def timed(timings, name):
+  started = time.perf_counter()
+  yield
+  timings.append((name, time.perf_counter() - started))
+
+def connect(database_url):
+  import psycopg2
+  return psycopg2.connect(database_url, options=f'-c search_path={SCHEMA}')
+
+def load_contacts(connection, gds_path):
+  with connection, connection.cursor() as cursor:
+    cursor.execute(CREATE_SCHEMA)
+    sink = CopySink(cursor, 'contacts', CONTACT_FIELDS, 10000)
+    for contact in generate_contacts(gds_path):
+      sink.write(contact)
+    sink.close()
+    cursor.execute('ANALYZE contacts')
+
+def load_calls(connection, calls_path, import_batch_size):
+  timings = []
+  with connection, connection.cursor() as cursor:
+    run_script(cursor, 'create_tmp_tables.sql')
+    with timed(timings, 'prepare and copy'):
+      copy_outputs(cursor, generate_outputs(calls_path, **USERS), 10000)
+    with timed(timings, 'prepare_import.sql'):
+      run_script(cursor, 'prepare_import.sql')
+    if not import_batch_size:
+      with timed(timings, 'import scripts'):
+        run_import_scripts(cursor)
+      drop_tmp_tables(cursor)
+
+  if import_batch_size:
+    with timed(timings, 'import scripts'):
+      import_in_batches(connection, import_batch_size)
+    with connection, connection.cursor() as cursor:
+      drop_tmp_tables(cursor)
+
+  with connection.cursor() as cursor:
+    cursor.execute('SELECT (SELECT count(*) FROM needs), (SELECT count(*) FROM notes)')
+    return timings, cursor.fetchone()
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+@click.option('-d', '--database-url', 'database_url', envvar='DATABASE_URL', required=True,
+              help='Defaults to $DATABASE_URL')
+@click.option('--import-batch-sizes', default='0,10000', show_default=True,
+              help='Contacts per batch to compare, 0 for a single transaction')
+def main(rows, database_url, import_batch_sizes):
+  connection = connect(database_url)
+  try:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      gds_path, calls_path = join(tmp_dir, 'gds.csv'), join(tmp_dir, 'calls.csv')
+      write_gds_file(gds_path, rows)
+      write_calls_file(calls_path, rows)
+
+      click.echo(f'{"batch size":>10} {"step":<20} {"seconds":>8}')
+      for import_batch_size in [int(size) for size in import_batch_sizes.split(',')]:
+        load_contacts(connection, gds_path)
+        timings, (need_count, note_count) = load_calls(connection, calls_path, import_batch_size)
+        for name, seconds in timings:
+          click.echo(f'{import_batch_size or "-":>10} {name:<20} {seconds:>8.2f}')
+        click.echo(f'{"":>10} {f"{need_count} needs, {note_count} notes":<20}')
+
+    with connection, connection.cursor() as cursor:
+      cursor.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+  finally:
+    connection.close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,33 @@
+"""Measures prepare-contacts throughput (rows/s) against the number of workers.
+
+  python -m benchmarks.prepare_contacts --rows 200000 --workers 1,2,4,8
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+import click
+
+from benchmarks.synthetic import write_gds_file
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+@click.option('--workers', 'workers_list', default='1,2,4', show_default=True)
+def main(rows, workers_list):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    gds_path = join(tmp_dir, 'gds.csv')
+    write_gds_file(gds_path, rows)
+
+    click.echo(f'{"workers":>8} {"seconds":>8} {"rows/s":>10}')
+    for workers in [int(n) for n in workers_list.split(',')]:
+      started = time.perf_counter()
+      subprocess.run([sys.executable, '-m', 'beacon.cli', 'prepare-contacts',
+                      gds_path, '--workers', str(workers)],
+                     stdout=subprocess.DEVNULL, check=True)
+      elapsed = time.perf_counter() - started
+      click.echo(f'{workers:>8} {elapsed:>8.2f} {rows / elapsed:>10.0f}')
+
+if __name__ == '__main__':
+  main()
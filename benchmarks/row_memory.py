@@ -0,0 +1,82 @@
+"""Compares the peak RSS of holding normalized call log rows as a dict per
+row, as before, and as CallRecords.
+
+  python -m benchmarks.row_memory --rows 100000
+
+Each representation is measured in a fresh process, holding every row of a
+synthetic call log at once, which is the worst case for a chunk in flight.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from os.path import join
+
+import click
+
+from beacon.calls_header_map import header_map, rename_map
+from beacon.helpers import parse_date, try_convert
+from beacon.prepare_calls import normalize_row
+from beacon.reader import read_columns
+from benchmarks.synthetic import write_calls_file
+
+# The implementation before CallRecord was added
+def dict_normalize_row(fields, values):
+  row = dict(zip(fields, values))
+  if not row['latest_attempt_date']:
+    return None
+
+  row['import_data'] = json.dumps(dict(zip(header_map.keys(), values)))
+  row['latest_attempt_date'] = try_convert(parse_date, row['latest_attempt_date'])
+  row['created_at'] = row['latest_attempt_date']
+  row['updated_at'] = row['latest_attempt_date']
+  return row
+
+def peak_rss_kb(*args):
+  """Runs this script with args, returning the child's peak RSS in KB"""
+
+  process = subprocess.Popen([sys.executable, '-m', 'benchmarks.row_memory', *args])
+  _, status, rusage = os.wait4(process.pid, 0)
+  if status:
+    raise click.ClickException(f"{' '.join(args)} failed")
+
+  # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+  scale = 1024 if sys.platform == 'darwin' else 1
+  return rusage.ru_maxrss // scale
+
+def hold_rows(input_path, representation):
+  fields, rows = read_columns(input_path, rename_map, encoding='windows-1252')
+  if representation == 'dict':
+    held = [dict_normalize_row(fields, values) for values in rows]
+  elif representation == 'record':
+    held = [normalize_row(source_row, values) for source_row, values in enumerate(rows, 1)]
+  else:
+    held = list(rows)
+  return len(held)
+
+@click.command()
+@click.option('--rows', default=100000, show_default=True)
+@click.option('--hold', 'hold', type=click.Choice(['none', 'dict', 'record']), hidden=True)
+@click.argument('input_path', required=False)
+def main(rows, hold, input_path):
+  if hold:
+    hold_rows(input_path, hold)
+    return
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    input_path = join(tmp_dir, 'calls.csv')
+    write_calls_file(input_path, rows)
+
+    # Rows as read, before normalizing, are the floor of both
+    floor = peak_rss_kb('--hold', 'none', input_path)
+    results = [(representation, peak_rss_kb('--hold', representation, input_path))
+               for representation in ['dict', 'record']]
+
+  click.echo(f'{"representation":<15} {"peak MB":>8} {"bytes/row":>10}')
+  click.echo(f'{"raw values":<15} {floor / 1024:>8.1f} {"":>10}')
+  for representation, peak in results:
+    click.echo(f'{representation:<15} {peak / 1024:>8.1f} {(peak - floor) * 1024 / rows:>10.0f}')
+
+if __name__ == '__main__':
+  main()
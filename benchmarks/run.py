@@ -0,0 +1,98 @@
+"""Times prepare-calls and prepare-contacts on synthetic data of a few sizes,
+and compares the results with a saved baseline.
+
+  python -m benchmarks.run --sizes 10000,100000,1000000 --save-baseline baseline.json
+  python -m benchmarks.run --sizes 10000,100000,1000000 --baseline baseline.json
+
+Each run records rows/s and the peak RSS of the command. Extra options after
+-- are passed to both commands, eg. -- --workers 4
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+import click
+
+from benchmarks.synthetic import write_calls_file, write_gds_file
+
+USERS = ['--food-needs-user', '1', '--complex-needs-user', '2',
+         '--simple-needs-user', '3', '--call-log-review-user', '4']
+
+def run_command(args, quiet=False):
+  """Runs a beacon command, returning its wall time and peak RSS in KB.
+     quiet hides its messages on stderr too."""
+
+  started = time.perf_counter()
+  process = subprocess.Popen([sys.executable, '-m', 'beacon.cli', *args],
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL if quiet else None)
+  # wait4 gives the resource usage of this one child
+  _, status, rusage = os.wait4(process.pid, 0)
+  elapsed = time.perf_counter() - started
+  process.returncode = status
+  if status:
+    raise click.ClickException(f"beacon {' '.join(args)} failed")
+
+  # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+  scale = 1024 if sys.platform == 'darwin' else 1
+  return elapsed, rusage.ru_maxrss // scale
+
+def benchmark(command, rows, extra_args):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    input_path = join(tmp_dir, 'input.csv')
+    if command == 'prepare-calls':
+      write_calls_file(input_path, rows)
+      args = [command, *USERS, '--output-dir', tmp_dir, input_path]
+    else:
+      write_gds_file(input_path, rows)
+      args = [command, input_path]
+
+    elapsed, peak_rss_kb = run_command([*args, *extra_args])
+
+  return {'command': command,
+          'rows': rows,
+          'seconds': round(elapsed, 3),
+          'rows_per_second': round(rows / elapsed),
+          'peak_rss_kb': peak_rss_kb}
+
+@click.command(context_settings={'ignore_unknown_options': True})
+@click.option('--sizes', default='10000,100000,1000000', show_default=True)
+@click.option('--commands', default='prepare-calls,prepare-contacts', show_default=True)
+@click.option('--baseline', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Results of an earlier run to compare with')
+@click.option('--save-baseline', 'save_path', type=click.Path(dir_okay=False, writable=True),
+              help='Where to save the results of this run')
+@click.argument('extra_args', nargs=-1, type=click.UNPROCESSED)
+def main(sizes, commands, baseline_path, save_path, extra_args):
+  baseline = {}
+  if baseline_path:
+    with open(baseline_path) as f:
+      baseline = { (r['command'], r['rows']): r for r in json.load(f) }
+
+  click.echo(f'{"command":<17} {"rows":>8} {"seconds":>8} {"rows/s":>9} {"peak MB":>8} {"vs baseline":>12}')
+  results = []
+  for command in commands.split(','):
+    for rows in [int(size) for size in sizes.split(',')]:
+      result = benchmark(command, rows, extra_args)
+      results.append(result)
+
+      comparison = ''
+      before = baseline.get((command, rows))
+      if before:
+        speed = result['rows_per_second'] / before['rows_per_second']
+        memory = result['peak_rss_kb'] / before['peak_rss_kb']
+        comparison = f'{speed:.2f}x, {memory:.2f}x mem'
+
+      click.echo(f"{command:<17} {rows:>8} {result['seconds']:>8.2f} "
+                 f"{result['rows_per_second']:>9} {result['peak_rss_kb'] / 1024:>8.1f} {comparison:>12}")
+
+  if save_path:
+    with open(save_path, 'w') as f:
+      json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+  main()
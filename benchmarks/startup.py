@@ -0,0 +1,67 @@
+"""Times how long beacon takes to start, and the overhead per file of running
+prepare-calls once per file compared with one batch run over all of them.
+
+  python -m benchmarks.startup --files 20 --rows 100 --repeat 5
+
+Startup times are the fastest of --repeat runs.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+import click
+
+from beacon.cli import COMMANDS
+from benchmarks.run import run_command
+from benchmarks.synthetic import write_calls_file
+
+USERS = {'food-needs-user': 1, 'complex-needs-user': 2,
+         'simple-needs-user': 3, 'call-log-review-user': 4}
+
+def fastest(run, repeat):
+  return min(run() for _ in range(repeat))
+
+def python_startup():
+  started = time.perf_counter()
+  subprocess.run([sys.executable, '-c', 'pass'], check=True)
+  return time.perf_counter() - started
+
+@click.command()
+@click.option('--files', default=20, show_default=True)
+@click.option('--rows', default=100, show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+def main(files, rows, repeat):
+  click.echo(f'python: {fastest(python_startup, repeat):.3f}s')
+  for args in [['--help'], *([command, '--help'] for command in COMMANDS)]:
+    seconds = fastest(lambda: run_command(args, quiet=True)[0], repeat)
+    click.echo(f"beacon {' '.join(args)}: {seconds:.3f}s")
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    jobs = []
+    for number in range(files):
+      calls_path = join(tmp_dir, f'calls{number}.csv')
+      output_dir = join(tmp_dir, f'output{number}')
+      os.mkdir(output_dir)
+      write_calls_file(calls_path, rows, seed=number)
+      jobs.append({'command': 'prepare-calls', 'input': calls_path, 'output-dir': output_dir})
+    manifest_path = join(tmp_dir, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+      json.dump({'defaults': {'prepare-calls': USERS}, 'jobs': jobs}, f)
+
+    separate = 0
+    for job in jobs:
+      users = [arg for name, value in USERS.items() for arg in (f'--{name}', str(value))]
+      separate += run_command(['prepare-calls', *users, '--output-dir', job['output-dir'],
+                               job['input']], quiet=True)[0]
+    batched, _ = run_command(['batch', manifest_path], quiet=True)
+
+  click.echo(f'{files} files of {rows} rows: {separate:.2f}s run separately '
+             f'({separate / files:.3f}s each), {batched:.2f}s in one batch '
+             f'({batched / files:.3f}s each)')
+
+if __name__ == '__main__':
+  main()
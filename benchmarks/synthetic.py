@@ -0,0 +1,170 @@
+"""Writes synthetic call logs and GDS extracts, so the importer can be run
+without real patient data.
+
+  python -m benchmarks.synthetic calls calls.csv --rows 100000
+  python -m benchmarks.synthetic gds gds.csv --rows 100000
+
+Call logs use the exact original headers from calls_header_map, in
+windows-1252 like the real spreadsheets. The NHS numbers of both files come
+from the same range, so every call log row has a matching contact.
+Distributions of the categorical columns can be overridden with a JSON file
+of {column: {value: weight}}.
+"""
+import csv
+import json
+import random
+
+import click
+
+from beacon.calls_header_map import header_map
+
+GDS_HEADER = ['NHSNumber', 'FirstName', 'MiddleName', 'LastName',
+              'Address1', 'Address2', 'Address3', 'Address4', 'Address5',
+              'Postcode', 'DOB', 'Phone', 'Mobile', 'Email', 'GPPracticeCode',
+              'OxygenTherapy', 'HomeAccess', 'Notes']
+
+FIRST_NHS_NUMBER = 9000000000
+
+# {value: weight} for the columns that drive the classification rules. The
+# trailing spaces are as they appear in the source spreadsheets.
+DISTRIBUTIONS = {
+  'was_contact_made': {
+    'Yes': 50,
+    'No -1 attempt made': 15,
+    'No 2 attempts made': 10,
+    'No 3 attempts made': 15,
+    'Invalid phone numbers': 5,
+    '': 5
+  },
+  'outcome': {
+    'Food referral ': 25,
+    'Food and Other referral': 10,
+    'Other referral': 10,
+    'Call back ': 15,
+    'Left voicemail': 15,
+    'No support needed': 25
+  },
+  'food_priority': {
+    '': 50,
+    'Priority 1 - urgent': 10,
+    'Priority 2': 15,
+    'Priority 3': 20,
+    'Unknown': 5
+  },
+  # Formats of the callback date, filled in by callback_date()
+  'callback_date': {
+    '': 60,
+    'dd/mm/yyyy': 20,
+    'dd.mm.yy': 10,
+    'Call back on dd/mm/yyyy': 5,
+    'next week': 5
+  },
+  'has_covid_symptoms': {
+    'No': 80,
+    'Yes': 5,
+    '': 15
+  },
+  'dietary_requirements': {
+    'No': 60,
+    'Vegetarian': 15,
+    'Halal': 10,
+    'Diabetic, no sugar': 10,
+    '': 5
+  },
+  # How often each additional support column is filled in
+  'additional_support': {
+    '': 90,
+    'Yes - resident would like a referral': 10
+  }
+}
+
+# Share of call log rows that are a repeat attempt for an earlier NHS number
+REPEAT_RATE = 0.1
+
+FREE_TEXT = ['', '', 'Lives with partner, daughter visits weekly',
+             'Neighbour helps with shopping', 'Prefers calls after 2pm',
+             'Café on the corner delivers – knows resident', 'Needs £20 top up']
+
+def choose(distribution):
+  values = list(distribution)
+  return random.choices(values, weights=[distribution[v] for v in values])[0]
+
+def random_date(year=2020):
+  return f'{random.randint(1, 28):02}/{random.randint(4, 6):02}/{year}'
+
+def callback_date(date_format):
+  day, month = random.randint(1, 28), random.randint(4, 6)
+  return (date_format.replace('dd', f'{day:02}')
+                     .replace('mm', f'{month:02}')
+                     .replace('yyyy', '2020')
+                     .replace('yy', '20'))
+
+def call_log_row(nhs_number, distributions):
+  row = { key: random.choice(FREE_TEXT) for key in header_map }
+  row.update({
+    'nhs_number': str(nhs_number),
+    'is_consolidation_record': random.choice(['', '', 'Yes']),
+    'latest_attempt_date': random_date(),
+    'latest_attempt_time': f'{random.randint(9, 17)}:{random.randint(0, 59):02}',
+    'was_contact_made': choose(distributions['was_contact_made']),
+    'outcome': choose(distributions['outcome']),
+    'food_priority': choose(distributions['food_priority']),
+    'book_weekly_food_delivery': random.choice(['', 'yes', 'no']),
+    'callback_date': callback_date(choose(distributions['callback_date'])),
+    'household_count': str(random.randint(1, 5)),
+    'has_covid_symptoms': choose(distributions['has_covid_symptoms']),
+    'dietary_requirements': choose(distributions['dietary_requirements'])
+  })
+  for key in header_map:
+    if key.startswith('addl_'):
+      row[key] = choose(distributions['additional_support'])
+  return [row[key] for key in header_map]
+
+def write_calls_file(path, rows, distributions=DISTRIBUTIONS,
+                     repeat_rate=REPEAT_RATE, seed=0):
+  random.seed(seed)
+  with open(path, 'w', encoding='windows-1252', newline='') as f:
+    writer = csv.writer(f)
+    writer.writerow([value['original'] for value in header_map.values()])
+    contact_count = 0
+    for _ in range(rows):
+      if contact_count and random.random() < repeat_rate:
+        nhs_number = FIRST_NHS_NUMBER + random.randrange(contact_count)
+      else:
+        nhs_number = FIRST_NHS_NUMBER + contact_count
+        contact_count += 1
+      writer.writerow(call_log_row(nhs_number, distributions))
+
+def write_gds_file(path, rows, seed=0):
+  random.seed(seed)
+  with open(path, 'w', newline='') as f:
+    writer = csv.writer(f)
+    writer.writerow(GDS_HEADER)
+    for i in range(rows):
+      writer.writerow([f'{FIRST_NHS_NUMBER + i}', 'Jane', random.choice(['', 'Ann']), 'Smith',
+                       f'{i} High Street', random.choice(['', 'Flat 2']), 'Camden', '',
+                       'London', 'NW1 1AA', f'{random.randint(1, 28):02}/04/1950',
+                       '02079740000', '07700900000', 'jane@example.com', 'F83001',
+                       random.choice(['Y', 'N']), '', random.choice(FREE_TEXT)])
+
+@click.command()
+@click.argument('kind', type=click.Choice(['calls', 'gds']))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--rows', default=10000, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--repeat-rate', default=REPEAT_RATE, show_default=True)
+@click.option('--distributions', 'distributions_path', type=click.Path(exists=True, dir_okay=False),
+              help='JSON file of {column: {value: weight}} overriding the defaults')
+def main(kind, path, rows, seed, repeat_rate, distributions_path):
+  if kind == 'gds':
+    write_gds_file(path, rows, seed=seed)
+    return
+
+  distributions = dict(DISTRIBUTIONS)
+  if distributions_path:
+    with open(distributions_path) as f:
+      distributions.update(json.load(f))
+  write_calls_file(path, rows, distributions, repeat_rate=repeat_rate, seed=seed)
+
+if __name__ == '__main__':
+  main()
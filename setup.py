@@ -4,10 +4,17 @@ setup(
     name="beacon_data_importer",
     version="2.0",
     packages=["beacon"],
+    package_data={"beacon": ["sql/*.sql"]},
     install_requires=[
         "click==7.1",
         "petl==1.3",
     ],
+    extras_require={
+        "postgres": ["psycopg2-binary"],
+        "columnar": ["numpy"],
+        "arrow": ["pyarrow"],
+        "zstd": ["zstandard"],
+    },
     entry_points="""
       [console_scripts]
       beacon=beacon.cli:main
@@ -0,0 +1,78 @@
+"""Stops prepare-calls partway, resumes it, and checks the outputs are the
+same as a run that wasn't stopped, for LF, CR and CRLF line endings.
+
+  python -m pytest tests
+"""
+import pytest
+from click.testing import CliRunner
+
+from beacon import checkpoint, prepare_calls
+from beacon.checkpoint import CHECKPOINT_FILE
+from benchmarks.synthetic import write_calls_file
+
+ROWS = 5000
+
+# The chunk that stops the run, after a few checkpoints
+STOP_AT_CHUNK = 3
+
+USERS = ['--food-needs-user', '1', '--complex-needs-user', '2',
+         '--simple-needs-user', '3', '--call-log-review-user', '4']
+
+@pytest.fixture(params=[b'\n', b'\r', b'\r\n'], ids=['lf', 'cr', 'crlf'])
+def calls_path(request, tmp_path):
+  path = tmp_path / 'calls.csv'
+  write_calls_file(path, ROWS)
+  path.write_bytes(path.read_bytes().replace(b'\r\n', b'\n').replace(b'\n', request.param))
+  return path
+
+def run(calls_path, output_dir, *args):
+  output_dir.mkdir(exist_ok=True)
+  return CliRunner().invoke(prepare_calls.prepare_calls,
+                            [*USERS, '--output-dir', str(output_dir), *args, str(calls_path)])
+
+def stop_at_chunk(number):
+  """A process_chunk() that stops the run at chunk number, as Ctrl-C would"""
+
+  chunks = 0
+  def process_chunk(chunk, **options):
+    nonlocal chunks
+    chunks += 1
+    if chunks == number:
+      raise KeyboardInterrupt()
+    return original_process_chunk(chunk, **options)
+
+  original_process_chunk = prepare_calls.process_chunk
+  return process_chunk
+
+def test_resume_matches_a_full_run(calls_path, tmp_path, monkeypatch):
+  full = run(calls_path, tmp_path / 'full')
+  assert full.exit_code == 0, full.output
+
+  resumed_dir = tmp_path / 'resumed'
+  with monkeypatch.context() as patch:
+    patch.setattr(checkpoint, 'CHECKPOINT_INTERVAL', 0)
+    patch.setattr(prepare_calls, 'process_chunk', stop_at_chunk(STOP_AT_CHUNK))
+    stopped = run(calls_path, resumed_dir)
+  assert stopped.exit_code != 0
+  assert (resumed_dir / CHECKPOINT_FILE).exists()
+
+  resumed = run(calls_path, resumed_dir, '--resume')
+  assert resumed.exit_code == 0, resumed.output
+  assert 'Resuming after row' in resumed.output
+  assert not (resumed_dir / CHECKPOINT_FILE).exists()
+
+  full_files = sorted(path.name for path in (tmp_path / 'full').iterdir())
+  assert sorted(path.name for path in resumed_dir.iterdir()) == full_files
+  for name in full_files:
+    assert (resumed_dir / name).read_bytes() == (tmp_path / 'full' / name).read_bytes(), name
+
+def test_resume_refuses_other_options(calls_path, tmp_path, monkeypatch):
+  output_dir = tmp_path / 'output'
+  with monkeypatch.context() as patch:
+    patch.setattr(checkpoint, 'CHECKPOINT_INTERVAL', 0)
+    patch.setattr(prepare_calls, 'process_chunk', stop_at_chunk(STOP_AT_CHUNK))
+    run(calls_path, output_dir)
+
+  result = run(calls_path, output_dir, '--resume', '--food-needs-user', '5')
+  assert result.exit_code != 0
+  assert 'food_needs_user changed' in result.output